@@ -5,7 +5,7 @@ import pandas as pd
 import os
 from contextlib import contextmanager
 from mesa.batchrunner import batch_run
-from model.model import City
+from model.model import City, configure_logging
 
 # Define the variable and fixed parameters
 variable_parameters = {
@@ -87,6 +87,7 @@ def get_subfolder(timestamp, variable_parameters):
 
 # Main execution
 if __name__ == '__main__':
+    configure_logging()
     fixed_parameters['timestamp'] = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
     subfolder = get_subfolder(fixed_parameters['timestamp'], variable_parameters)
     fixed_parameters['subfolder'] = subfolder
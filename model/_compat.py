@@ -0,0 +1,21 @@
+"""Optional dependencies.
+
+Numba is used to compile numeric kernels when it is installed. Without
+it, ``njit`` returns the decorated function unchanged, so the kernels
+run as plain Python.
+"""
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit when numba is not installed."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
@@ -1,17 +1,19 @@
 import math
 import logging
-from typing import Union
-from collections import defaultdict
-from scipy.spatial import distance
+from typing import NamedTuple, Union
+import numpy as np
 
 from mesa import Agent
 
-logging.basicConfig(filename='logfile.log',
-                    filemode='w',
-                    level=logging.DEBUG,
-                    format='%(asctime)s %(name)s %(levelname)s:%(message)s')
+from model.firm_kernel import _firm_step
+from model.person_kernel import DECISION_WORK, DECISION_RETIRE, DECISION_IDLE, _person_decisions
+
 logger = logging.getLogger(__name__)
 
+# Values of the _kind attribute used to dispatch on buyer and seller type
+KIND_PERSON   = 0
+KIND_INVESTOR = 1
+
 class Land(Agent):
     """Land parcel.
 
@@ -20,14 +22,25 @@ class Land(Agent):
     :param pos: The land parcel's location on the spatial grid.
     :param resident: The agent who resides at this land parcel.
     :param owner: The agent who owns this land parcel.
+    :param distance_from_center: Distance to the city center, which the
+                                 model computes for all parcels at once.
+
+    Parcels are only created during model setup, one per grid cell, since
+    the model's land arrays hold exactly n_land parcels.
     """
 
+    # transport_cost and property_tax_rate are stored in the model's land arrays
+    __slots__ = ('unique_id', 'model', 'pos', '_idx',
+                 'resident', 'owner', 'distance_from_center')
+
+    # Columns of the scheduler's AgentArray for land, see step_vectorized
+    soa_columns = {'_idx': np.int64}
+    # Each parcel only records its own prices, so the step order does not matter
+    order_independent = True
+
     @property
     def warranted_rent(self):
-        wage_premium     = self.model.firm.wage_premium
-        subsistence_wage = self.model.firm.subsistence_wage
-        a                = self.model.housing_services_share
-        return wage_premium - self.transport_cost + a * subsistence_wage # TODO add amenity + A
+        return self.model.warranted_rent_arr[self._idx] # TODO add amenity + A
 
     @property 
     def market_rent(self):
@@ -35,11 +48,11 @@ class Land(Agent):
 
     @property
     def net_rent(self):
-        return self.warranted_rent - self.maintenance - self.property_tax
+        return self.model.net_rent_arr[self._idx]
 
     @property
     def warranted_price(self):
-        return self.warranted_rent / self.model.r_prime
+        return self.model.warranted_price_arr[self._idx]
     
     @property
     def appraised_price(self):
@@ -53,43 +66,57 @@ class Land(Agent):
 
     @property
     def maintenance(self):
-        a                 = self.model.housing_services_share
-        b                 = self.model.maintenance_share
-        subsistence_wage  = self.model.firm.subsistence_wage # subsistence_wage
-        return a * b * subsistence_wage
+        c = self.model._step_cache
+        return c.a * c.b * c.sw
+
+    @property
+    def transport_cost(self):
+        return self.model.land_transport_cost[self._idx]
+
+    @transport_cost.setter
+    def transport_cost(self, value):
+        self.model.land_transport_cost[self._idx] = value
+
+    @property
+    def property_tax_rate(self):
+        return self.model.land_tax_rate[self._idx]
+
+    @property_tax_rate.setter
+    def property_tax_rate(self, value):
+        self.model.land_tax_rate[self._idx] = value
 
     def __init__(self, unique_id, model, pos, 
                  property_tax_rate = 0., 
-                 resident = None, owner = None):
+                 resident = None, owner = None, *,
+                 distance_from_center):
         super().__init__(unique_id, model)
+        # Index of this parcel in the model's land arrays
+        self._idx                 = len(self.model.land_parcels)
+        if self._idx >= self.model.n_land:
+            raise ValueError("Land parcels can only be created during model setup.")
+        self.model.land_parcels.append(self)
+
         self.pos                  = pos
         self.property_tax_rate    = property_tax_rate
         self.resident             = resident
         self.owner                = owner
-        self.distance_from_center = self.calculate_distance_from_center()
+        self.distance_from_center = distance_from_center
         self.transport_cost       = self.calculate_transport_cost()
         # TODO want to make distance from center, warranted price, realized price.
 
     def step(self):
-        # Prepare price data for the current step
-        price_data = {
-            'id': self.unique_id,
-            'warranted_price': self.warranted_price,
-            'time_step': self.model.time_step,
-            'transport_cost': self.transport_cost,
-            'wage': self.model.firm.wage
-       }
-        # Add the price data to the model's step price data
-        self.model.step_price_data.append(price_data)
-
-    def calculate_distance_from_center(self, method='euclidean'):
-        if method == 'euclidean':
-            return distance.euclidean(self.pos, self.model.center)
-        elif method == 'cityblock':
-            return distance.cityblock(self.pos, self.model.center)
-        else:
-            raise ValueError("Invalid distance calculation method."
-                            "Supported methods are 'euclidean' and 'cityblock'.")
+        # The scheduler normally records all parcels in one pass, see step_vectorized
+        self.model.record_price_data(np.array([self._idx]))
+
+    @staticmethod
+    def step_vectorized(model, arrays, order):
+        """Record this step's prices for the land parcels in order.
+
+        :param model: The main city model.
+        :param arrays: The scheduler's AgentArray for land.
+        :param order: Rows of arrays to step.
+        """
+        model.record_price_data(arrays['_idx'][order])
 
     def calculate_transport_cost(self):
         cost = self.distance_from_center * self.model.transport_cost_per_dist
@@ -99,15 +126,50 @@ class Land(Agent):
         return f"Land {self.unique_id} (Dist. {self.distance_from_center}, Pw {self.warranted_price})"
 
 class Person(Agent):
+    __slots__ = ('unique_id', 'model', 'pos', 'workforce', '_kind', 'role_flags',
+                 'init_working_period', 'savings', 'wealth',
+                 'properties_owned', 'residence', 'bank', 'amenity', 'count',
+                 '_borrowing_rate', '_decision')
+
+    # Bits of role_flags, kept in sync with the workforce dictionaries
+    NEWCOMER = 1
+    RETIRING = 2
+    WORKER   = 4
+
+    # Columns of the scheduler's AgentArray for people. City.step_persons
+    # reads the current working periods and writes the next ones, see AgentArray
+    soa_columns          = {'working_period': np.int64}
+    soa_buffered_columns = ('working_period',)
+
+    @property
+    def working_period(self):
+        """Working period, stored in the scheduler's AgentArray once scheduled."""
+        arrays = self.model.schedule.agent_arrays.get(Person)
+        row    = -1 if arrays is None else arrays.row(self.unique_id)
+        if row < 0:
+            # Not in the schedule, so still at its initial working period
+            return self.init_working_period
+        return arrays['working_period'][row]
+
+    @working_period.setter
+    def working_period(self, value):
+        arrays = self.model.schedule.agent_arrays[Person]
+        arrays['working_period'][arrays.row(self.unique_id)] = value
+
     @property
     def borrowing_rate(self):
         """Borrowing rate of the person.
 
         Returns:
         The borrowing rate calculated based on the model's  \
-        target rate and individual wealth adjustment.
+        target rate and individual wealth adjustment, as last \
+        set by update_borrowing_rate.
         """
-        return self.model.r_target + self.individual_wealth_adjustment
+        return self._borrowing_rate
+
+    def update_borrowing_rate(self):
+        """Recompute the borrowing rate, once per step rather than per bid."""
+        self._borrowing_rate = self.model.r_target + self.individual_wealth_adjustment
 
     @property
     def individual_wealth_adjustment(self):
@@ -136,9 +198,10 @@ class Person(Agent):
         super().__init__(unique_id, model)
         self.pos = pos
         self.workforce = self.model.workforce
+        self._kind = KIND_PERSON
+        self.role_flags = 0 # Workforce membership bits, set by Workforce.add and remove
 
         self.init_working_period = init_working_period
-        self.working_period      = init_working_period
         self.savings             = savings
 
         self.properties_owned    = []
@@ -146,45 +209,67 @@ class Person(Agent):
 
         self.bank                = self.model.bank 
         self.amenity             = 0.
+        # Newcomers bid before their first step, so set the rate now
+        self.update_borrowing_rate()
 
 
         # If the agent initially owns a property, set residence and owners
         if self.residence:
             self.properties_owned.append(self.residence)
             if self.residence.owner is not None:
-                logger.warning(f'Property {self.residence.unique_id} has \
-                                 owner {self.residence.owner}, now \
-                                 owned by {self.unique_id} in init.')
+                logger.warning('Property %s has owner %s, now owned by %s in init.',
+                               self.residence.unique_id, self.residence.owner, self.unique_id)
             self.residence.owner = self
 
             if self.residence.resident is not None:
-                logger.warning(f'Property {self.residence.unique_id} has \
-                                 resident {self.residence.resident}, now \
-                                 assigned to {self.unique_id} in init.')
+                logger.warning('Property %s has resident %s, now assigned to %s in init.',
+                               self.residence.unique_id, self.residence.resident, self.unique_id)
             self.residence.resident = self
 
         # Count time step and track whether agent is working
         self.count               = 0
+        self._decision           = DECISION_IDLE
 
     def step(self):
+        self.precompute_state()
+        self.working_period += 1
+        self.apply_state()
+
+    def precompute_state(self):
+        """Decide whether to retire or work this step, without side effects.
+
+        Uses person_kernel._person_decisions, with which City.step_persons
+        decides for every person at once.
+        """
+        transport_cost = np.inf if self.residence is None else self.residence.transport_cost
+        self._decision = _person_decisions(np.array([self.working_period]),
+                                           self.model.working_periods,
+                                           self.model.firm.wage_premium,
+                                           np.array([transport_cost]))[0]
+
+    def apply_state(self):
+        """Carry out the step decided by precompute_state.
+
+        The working period has already been advanced, by step or by
+        City.step_persons.
+        """
+        self.update_borrowing_rate()
         self.count              += 1
-        self.working_period     += 1
 
         # Newcomers, who don't find a home, leave the city
-        if (self.unique_id in self.workforce.newcomers):
+        if self.role_flags & self.NEWCOMER:
             if (self.residence == None):
                 if (self.count > 0):
-                    logger.debug(f'Newcomer {self.unique_id} removed, who \
-                                   owns {self.properties_owned}.')
+                    logger.debug('Newcomer %s removed, who owns %s.',
+                                 self.unique_id, self.properties_owned)
                     self.remove()
             else:
-                logger.error(f'Newcomer {self.unique_id} has a \
-                               residence {self.residence.unique_id}, \
-                               but was not removed from newcomer list.')
+                logger.error('Newcomer %s has a residence %s, but was not removed from newcomer list.',
+                             self.unique_id, self.residence.unique_id)
 
-        elif (self.residence) and (self.unique_id not in self.workforce.retiring):
+        elif (self.residence) and not (self.role_flags & self.RETIRING):
             # Retire if past retirement age
-            if (self.working_period > self.model.working_periods):
+            if self._decision == DECISION_RETIRE:
                 self.workforce.add(self, self.workforce.retiring)
                 # List homes for sale
                 if (self.residence in self.properties_owned):
@@ -194,8 +279,7 @@ class Person(Agent):
 
             # Work if it is worthwhile to work
             else:
-                premium = self.model.firm.wage_premium
-                if premium > self.residence.transport_cost:
+                if self._decision == DECISION_WORK:
                     # Add the person to the workforce's workers dictionary if not already present
                     self.workforce.add(self, self.workforce.workers)
                 else:
@@ -206,11 +290,11 @@ class Person(Agent):
             self.savings += self.model.savings_per_step # TODO debt, wealth
             self.wealth  = self.get_wealth()
 
-        elif self.unique_id in self.workforce.retiring:
-            logger.debug(f'Retiring agent {self.unique_id} still in model.')
+        elif self.role_flags & self.RETIRING:
+            logger.debug('Retiring agent %s still in model.', self.unique_id)
 
         else:
-            logger.debug(f'Agent {self.unique_id} has no residence.')
+            logger.debug('Agent %s has no residence.', self.unique_id)
 
     def bid(self):
         """Newcomers bid on properties for use or investment value."""
@@ -221,13 +305,16 @@ class Person(Agent):
         m = self.get_max_mortgage_share()
         M = self.get_max_mortgage()
         
-        r_target = self.model.r_target # TODO this is personal but uses same as bank. Clarify.
+        r_target = self.model._step_cache.r_target # TODO this is personal but uses same as bank. Clarify.
         
+        sale_listing = self.model.realtor.sale_listing
+        if not sale_listing:
+            return
 
-        for sale_property in self.model.realtor.sale_listing:
+        R_N        = np.fromiter((p.net_rent for p in sale_listing), np.float64, count=len(sale_listing))
+        P_max_bids = self.model.bank.get_max_bids(R_N, [r], r_target, [m])[0]
 
-            R_N = sale_property.net_rent
-            P_max_bid = self.model.bank.get_max_bid(R_N, r, r_target, m, sale_property.transport_cost)
+        for sale_property, P_max_bid in zip(sale_listing, P_max_bids):
 
             if m * P_max_bid < m:
                 mortgage = m * P_max_bid
@@ -237,12 +324,11 @@ class Person(Agent):
                 mortgage = M
                 P_bid = min(M + S, P_max_bid)
 
-            bid = Bid(bidder=self, property=sale_property, price=P_bid, mortgage=mortgage)
-            logger.debug(f'Person {self.unique_id} bids {bid.price} \
-                        for property {sale_property.unique_id}, \
-                        if val is positive.')
-            if bid.price > 0:
-                self.model.realtor.add_bid(self, sale_property, bid.price)
+            # Only positive bids are recorded, in the realtor's bid arrays
+            if P_bid > 0:
+                logger.debug('Person %s bids %s for property %s.',
+                             self.unique_id, P_bid, sale_property.unique_id)
+                self.model.realtor.add_bid(self, sale_property, P_bid)
 
     def get_wealth(self):
         # TODO Wealth is properties owned, minuse mortgages owed, plus savings.
@@ -252,11 +338,10 @@ class Person(Agent):
         return 0.8
     
     def get_max_mortgage(self):
+        c        = self.model._step_cache
         S        = self.savings
         r        = self.borrowing_rate
-        r_prime  = self.model.r_prime
-        wage     = self.model.firm.wage
-        return 0.28 * (wage + r * S) / r_prime
+        return 0.28 * (c.wage + r * S) / c.r_prime
 
     def remove(self):
         self.model.removed_agents += 1
@@ -279,6 +364,14 @@ class Firm(Agent):
     :param init_wage_premium: initial urban wage premium.
     """
 
+    __slots__ = ('unique_id', 'model', 'pos',
+                 'subsistence_wage', 'alpha', 'beta', 'gamma', 'price_of_output',
+                 'seed_population', 'density', 'A', 'overhead', 'mult', 'c',
+                 'adjN', 'adjk', 'adjn', 'adjF', 'adjw', 'dist', 'r',
+                 'y', 'Y', 'F', 'k', 'n', 'N', 'F_target', 'agglomeration_population',
+                 'wage_premium', 'wage', 'MPL', 'wage_target', 'y_target', 'k_target',
+                 '_N_multiplier')
+
     # # TODO include seed population?
     # @property
     # def N(self):
@@ -339,6 +432,8 @@ class Firm(Agent):
         self.adjF     = adjF
         self.adjw     = adjw
         self.dist     = dist
+        # If the city is in the bottom corner center_city is false, and effective population must be multiplied by 4
+        self._N_multiplier = density * (1 if model.center_city else 4)
         # agent_count = 50 # TODO comes from agents deciding
         self.r        = r_prime # Firm cost of capital
 
@@ -360,30 +455,20 @@ class Firm(Agent):
     def step(self):
         # GET POPULATION AND OUTPUT TODO replace N with agent count
         self.N = self.get_N() # TODO make sure all relevant populations are tracked - n, N, N adjustedx4/not, agent count, agglomeration_population
-        self.agglomeration_population = self.mult * self.N + self.seed_population
-        self.n =  self.N / self.F # distribute workforce across firms
-        self.y = self.A * self.agglomeration_population**self.gamma *  self.k**self.alpha * self.n**self.beta
-
-        # ADJUST WAGE
-        self.MPL = self.beta  * self.y / self.n  # marginal value product of labour known to firms
-        self.wage_target = self.subsistence_wage + (self.MPL - self.subsistence_wage) / (1 + self.overhead)       #self.wage_target = self.MPL / (1 + self.overhead) # (1+self.overhead) # economic rationality implies intention
-        self.wage = (1 - self.adjw) * self.wage + self.adjw * self.wage_target # assume a partial adjustment process
-        
-        # FIND POPULATION AT NEW WAGE
-        self.wage_premium = self.wage - self.subsistence_wage # find wage available for transportation
+        # Output, wage, firm count and capital update, see firm_kernel._firm_step
+        (self.agglomeration_population, self.n, self.y, self.MPL, self.wage_target,
+         self.wage, self.wage_premium, self.F_target, self.F, self.y_target,
+         self.k_target, self.k) = _firm_step(
+            self.N, self.F, self.k, self.wage, self.A,
+            self.alpha, self.beta, self.gamma,
+            self.subsistence_wage, self.overhead, self.adjw, self.adjF, self.adjk,
+            self.r, self.price_of_output, self.mult, self.seed_population)
+
+        #self.wage_target = self.MPL / (1 + self.overhead) # (1+self.overhead) # economic rationality implies intention
         #self.dist = self.wage_premium / self.c  # find calculated extent of city at wage
         #self.N = self.dist * self.model.height * self.density / self.mult # calculate total firm population from city size # TODO make this expected pop
         #self.n =  self.N / self.F # distribute workforce across firms
 
-        # ADJUST NUMBER OF FIRMS
-        self.F_target = self.F * self.wage_target/self.wage  # this is completely arbitrary but harmless
-        self.F = (1 - self.adjF) * self.F + self.adjF * self.F_target
- 
-        # ADJUST CAPITAL STOCK 
-        self.y_target = self.price_of_output * self.A * self.agglomeration_population**self.gamma *  self.k**self.alpha * self.n**self.beta
-        self.k_target = self.alpha * self.y_target/self.r
-        self.k = (1 - self.adjk) * self.k + self.adjk * self.k_target
-    
         #self.F_target = self.F * self.n_target/self.n  #this is completely argbitrary but harmless
         # self.F_target = self.F*(self.n_target/self.n)**.5 # TODO name the .5
         ####self.F_target = (1-self.adjF)*self.F + self.adjF*self.F*(self.n_target/self.n) 
@@ -439,46 +524,47 @@ class Firm(Agent):
     #     return A_F * N**gamma * k**alpha_F * n**beta_F
 
     def get_N(self):
-        # If the city is in the bottom corner center_city is false, and effective population must be multiplied by 4
         # TODO think about whether this multiplier needs to come in elsewhere
         worker_agent_count = self.model.workforce.get_agent_count(self.model.workforce.workers)
-        if self.model.center_city:
-            N = self.density * worker_agent_count
-        else:
-            N = 4 * self.density * worker_agent_count
-        # TODO handle divide by zero errors
-        if N == 0:
-            N = 1
-        return N
+        # At least 1 so the firm step never divides by zero
+        return max(self._N_multiplier * worker_agent_count, 1)
 
 class Bank(Agent):
+    __slots__ = ('unique_id', 'model', 'pos')
+
     def __init__(self, unique_id, model, pos,
                  r_prime = 0.05, max_mortgage_share = 0.9,
                  ):
         super().__init__(unique_id, model)
         self.pos = pos
 
-    def get_max_bid(self, R_N, r, r_target, m, transport_cost):
-        T      = self.model.mortgage_period
-        delta  = self.model.delta
-        p_dot  = self.model.get_p_dot() #(transport_cost)
-
-        # if R_N is None:
-        #     print("Value R_N is None.")
-        # if r is None:
-        #     print("Value r is None.")
-        # if r_target is None:
-        #     print("Value r_target is None.")
-        # if m is None:
-        #     print("Value m is None.")
-        # if p_dot is None:
-        #     print("Value p_dot is None.")
-
-        # if R_N is not None and r is not None and r_target is not None and m is not None and p_dot is not None:
-        R_NT   = ((1 + r)**T - 1) / r * R_N
-        return R_NT / ((1 - m) * r_target/(delta**T) - p_dot)
+    def get_max_bid(self, R_N, r, r_target, m):
+        """Maximum bid of one bidder on one property, see get_max_bids."""
+        return self.get_max_bids([R_N], [r], r_target, [m])[0, 0]
+
+    def get_max_bids(self, R_N, r, r_target, m):
+        """Maximum bids of several bidders on several properties.
+
+        The annuity factor and denominator are computed once per bidder
+        rather than once per bid.
+
+        :param R_N: Net rents of the properties, one per property.
+        :param r: Borrowing rates, one per bidder.
+        :param r_target: Target rate, a scalar or one per bidder.
+        :param m: Maximum mortgage shares, one per bidder.
+        :returns: Array of maximum bids, with bidders as rows and properties as columns.
+        """
+        c              = self.model._step_cache
+        R_N            = np.asarray(R_N, dtype=np.float64)
+        r              = np.asarray(r, dtype=np.float64)
+        m              = np.asarray(m, dtype=np.float64)
+
+        annuity_factor = ((1 + r)**c.T - 1) / r
+        denom          = (1 - m) * r_target/c.delta_T - c.p_dot
+        return annuity_factor[:, None] * R_N[None, :] / denom[:, None]
 
 class Investor(Agent):
+    __slots__ = ('unique_id', 'model', 'pos', '_kind', 'properties_owned')
 
     @property
     def borrowing_rate(self):
@@ -487,6 +573,7 @@ class Investor(Agent):
     def __init__(self, unique_id, model, pos, properties_owned = []):
         super().__init__(unique_id, model)
         self.pos = pos
+        self._kind = KIND_INVESTOR
 
         # Properties for bank as an asset holder
         # self.property_management_costs = property_management_costs # TODO 
@@ -505,7 +592,7 @@ class Investor(Agent):
         # for sale_property in self.model.realtor.sale_listing:
         #     R_N = sale_property.net_rent
         #     print(R_N)
-        #     P_max_bid = self.model.bank.get_max_bid(R_N, r, r_target, m, sale_property.transport_cost)
+        #     P_max_bid = self.model.bank.get_max_bid(R_N, r, r_target, m)
         #     mortgage = m * P_max_bid
         #     # bid = Bid(bidder=self, property=sale_property, price=P_max_bid, mortgage=mortgage)
         #     logger.debug(f'Bank {self.unique_id} bids {bid.price} for \
@@ -515,6 +602,10 @@ class Investor(Agent):
     
 class Realtor(Agent):
     """Realtor agents connect sellers, buyers, and renters."""
+
+    __slots__ = ('unique_id', 'model', 'pos', 'workforce', 'sale_listing', 'rental_listing',
+                 '_n_bids', '_bid_price_buf', '_bid_bidder_buf', '_bid_property_buf')
+
     def __init__(self, unique_id, model, pos):
         super().__init__(unique_id, model)
         self.pos = pos
@@ -523,12 +614,41 @@ class Realtor(Agent):
         self.sale_listing = []
         self.rental_listing = []
 
-        self.bids = defaultdict(list)
+        # Bid book: bid price, bidder unique_id and property _idx per bid
+        capacity               = max(self.model.n_land, 64)
+        self._n_bids           = 0
+        self._bid_price_buf    = np.empty(capacity, np.float64)
+        self._bid_bidder_buf   = np.empty(capacity, np.int64)
+        self._bid_property_buf = np.empty(capacity, np.int64)
 
     def step(self):
         pass
 
     def add_bid(self, bidder, property, price):
+        if __debug__:
+            self._check_bid(bidder, property, price)
+
+        i = self._n_bids
+        if i == len(self._bid_price_buf):
+            self._grow_bid_buffers(i + 1)
+        self._bid_price_buf[i]    = price
+        self._bid_bidder_buf[i]   = bidder.unique_id
+        self._bid_property_buf[i] = property._idx
+        self._n_bids = i + 1
+
+    def add_bids(self, bidder_ids, property_idxs, prices):
+        """Add many bids at once from arrays of bidder unique_ids,
+        property _idx values, and bid prices."""
+        i = self._n_bids
+        j = i + len(prices)
+        if j > len(self._bid_price_buf):
+            self._grow_bid_buffers(j)
+        self._bid_price_buf[i:j]    = prices
+        self._bid_bidder_buf[i:j]   = bidder_ids
+        self._bid_property_buf[i:j] = property_idxs
+        self._n_bids = j
+
+    def _check_bid(self, bidder, property, price):
         # Type check for bidder and property
         if not isinstance(bidder, Person):
             raise ValueError("Bidder must be of type Person.")
@@ -536,34 +656,96 @@ class Realtor(Agent):
             raise ValueError("Property must be of type Land.")
         if not isinstance(price, (int, float)):
             raise ValueError("Price must be a numeric value (int or float).")
-        
-        bid = Bid(bidder, property, price)
-        self.bids[property].append(bid)
+
+    def _grow_bid_buffers(self, min_capacity):
+        capacity = max(2 * len(self._bid_price_buf), min_capacity)
+        n        = self._n_bids
+        for name in ('_bid_price_buf', '_bid_bidder_buf', '_bid_property_buf'):
+            old = getattr(self, name)
+            new = np.empty(capacity, old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def collect_bids_vectorized(self, bidders=None):
+        """Collect bids from all bidders on all listed properties at once.
+
+        Equivalent to calling Person.bid for each bidder, but computes the
+        full bidder by property matrix of bids with numpy broadcasting.
+
+        :param bidders: Persons bidding. Defaults to the current newcomers.
+        """
+        if bidders is None:
+            bidders = list(self.workforce.newcomers.values())
+        listing = self.sale_listing
+        if not bidders or not listing:
+            return
+
+        n   = len(bidders)
+        R_N = np.fromiter((p.net_rent for p in listing), np.float64, count=len(listing))
+        r   = np.fromiter((b._borrowing_rate for b in bidders), np.float64, count=n)
+        S   = np.fromiter((b.savings for b in bidders), np.float64, count=n)
+        m   = np.fromiter((b.get_max_mortgage_share() for b in bidders), np.float64, count=n)
+        M   = np.fromiter((b.get_max_mortgage() for b in bidders), np.float64, count=n)
+
+        # Rows are bidders, columns are listed properties
+        r_target  = self.model._step_cache.r_target
+        P_max_bid = self.model.bank.get_max_bids(R_N, r, r_target, m)
+
+        m_P_max   = m[:, None] * P_max_bid
+        mortgage  = np.where(m_P_max < m[:, None], m_P_max, M[:, None])
+        P_bid     = np.minimum(mortgage + S[:, None], P_max_bid)
+
+        # Record positive bids in the same order as bidding one person at a time
+        rows, cols = np.nonzero(P_bid > 0)
+        logger.debug('%s bidders placed %s positive bids on %s properties.',
+                     n, len(rows), len(listing))
+        bidder_ids    = np.fromiter((b.unique_id for b in bidders), np.int64, count=n)
+        property_idxs = np.fromiter((p._idx for p in listing), np.int64, count=len(listing))
+        self.add_bids(bidder_ids[rows], property_idxs[cols], P_bid[rows, cols])
 
     def sell_homes(self):
-        for key, value in self.bids.items():
-            print(f'Key: {key}')
-            for bid in value:
-                print(f'  {bid}')
-        
+        n = self._n_bids
+        logger.debug('%s bids to process.', n)
+
         allocations = []
-        for property in self.bids.keys():
-            if not isinstance(property, Land):
-                raise TypeError(f"Property in self.bids.keys is not of type 'Land'.")
-
-            property_bids = self.bids[property]
-            if len(property_bids) > 0:
-                property_bids.sort(key=lambda x: x.price, reverse=True)
-                highest_bid = property_bids[0]
-                second_highest_bid = property_bids[1].price if len(property_bids) > 1 else 0
-                final_price = highest_bid.price
-                allocation = Allocation(property, highest_bid.bidder, highest_bid.price, second_highest_bid, final_price)
-                print(allocation)
+        if n > 0:
+            prices     = self._bid_price_buf[:n]
+            bidder_ids = self._bid_bidder_buf[:n]
+            properties = self._bid_property_buf[:n]
+            agents     = self.model.schedule._agents
+            parcels    = self.model.land_parcels
+
+            # Group bids by property, keeping each property's bids in arrival order
+            order        = np.argsort(properties, kind='stable')
+            sorted_props = properties[order]
+            starts       = np.flatnonzero(np.r_[True, sorted_props[1:] != sorted_props[:-1]])
+            ends         = np.r_[starts[1:], n]
+
+            # Sell properties in the order they first received a bid
+            for k in np.argsort(order[starts], kind='stable'):
+                if ends[k] - starts[k] == 1:
+                    # Uncontested lot, no need to rank bids
+                    winning_bid        = order[starts[k]]
+                    highest_bid        = prices[winning_bid]
+                    second_highest_bid = 0
+                else:
+                    property_bids = order[starts[k]:ends[k]]
+                    bid_prices    = prices[property_bids]
+                    # argmax picks the earliest of any tied highest bids
+                    best          = np.argmax(bid_prices)
+                    winning_bid   = property_bids[best]
+                    highest_bid   = bid_prices[best]
+                    second_highest_bid = np.partition(bid_prices, -2)[-2]
+                final_price = highest_bid
+                allocation  = Allocation(parcels[sorted_props[starts[k]]],
+                                         agents[bidder_ids[winning_bid]],
+                                         highest_bid, second_highest_bid, final_price)
+                logger.debug('%s', allocation)
                 allocations.append(allocation)
-            # TODO compute final price given wtp
+                # TODO compute final price given wtp
 
         self.complete_transactions(allocations)
-        self.bids.clear()
+        self._n_bids = 0
         return allocations # TODO returning for testing. Do we need this? Does it interfere with main code?
 
     def complete_transactions(self, allocations):
@@ -574,18 +756,15 @@ class Realtor(Agent):
 
             self.transfer_property(seller, buyer, allocation.property)
 
-            if isinstance(buyer, Investor):
+            if buyer._kind == KIND_INVESTOR:
                 self.handle_investor_purchase(buyer, allocation.property)
-                print('investor buyer')
-            elif isinstance(buyer, Person):
+            elif buyer._kind == KIND_PERSON:
                 self.handle_person_purchase(buyer, allocation.property, final_price)
-                print('person buyer')
             else:
                 logger.warning('Buyer was neither a person nor an investor.')
-                print('neither buyer')
 
             # TODO integrate with person buyer case above
-            if isinstance(seller, Person):
+            if seller._kind == KIND_PERSON:
                 self.handle_seller_departure(seller)
             else:
                 logger.warning('Seller was not a person, so was not removed from the model.')
@@ -614,26 +793,27 @@ class Realtor(Agent):
     def handle_seller_departure(self, seller):
         """Handles the departure of a selling agent."""
         if seller.unique_id in self.workforce.retiring:
-            print('seller removed')
+            logger.debug('Seller %s removed.', seller.unique_id)
             seller.remove()
         else:
             logger.warning('Seller was not retiring, so was not removed from the model.')
 
     def rent_homes(self):
         """Rent homes listed by investors    to newcomers."""
-        logger.debug(f'{len(self.rental_listing)} properties to rent.')
+        logger.debug('%s properties to rent.', len(self.rental_listing))
         for rental in self.rental_listing:
             renter = self.model.create_newcomer()
             rental.resident = renter
             renter.residence = rental
             self.workforce.remove(renter, self.workforce.newcomers)
-            logger.debug(f'Newly created renter {renter.unique_id} lives at '
-                         f'property {renter.residence.unique_id} which has '
-                         f'resident {rental.resident.unique_id}.')
+            logger.debug('Newly created renter %s lives at property %s which has resident %s.',
+                         renter.unique_id, renter.residence.unique_id, rental.resident.unique_id)
         self.rental_listing.clear()
 
 
 class Bid:
+    __slots__ = ('bidder', 'property', 'price', 'mortgage')
+
     def __init__(
         self, 
         bidder: Person, 
@@ -641,18 +821,19 @@ class Bid:
         price: Union[float, int], 
         mortgage: Union[float, int] = 0.0
     ):
-        if not isinstance(bidder, Person):
-            raise ValueError("Bidder must be of type Person.")
-        
-        if not isinstance(property, Land):
-            raise ValueError("Property must be of type Land.")
-        
-        if not isinstance(price, (float, int)):
-            raise ValueError("Price must be a numeric value.")
-        
-        if not isinstance(mortgage, (float, int)):
-            raise ValueError("Mortgage must be a numeric value.")
-        
+        if __debug__:
+            if not isinstance(bidder, Person):
+                raise ValueError("Bidder must be of type Person.")
+
+            if not isinstance(property, Land):
+                raise ValueError("Property must be of type Land.")
+
+            if not isinstance(price, (float, int)):
+                raise ValueError("Price must be a numeric value.")
+
+            if not isinstance(mortgage, (float, int)):
+                raise ValueError("Mortgage must be a numeric value.")
+
         self.bidder = bidder
         self.property = property
         self.price = price
@@ -662,35 +843,18 @@ class Bid:
         return f"Bidder: {self.bidder}, Property: {self.property}, Price: {self.price}, Mortgage: {self.mortgage}"
 
 
-class Allocation:
-    def __init__(
-        self, 
-        property: Land, 
-        successful_bidder: Person, 
-        highest_bid: Union[float, int], 
-        second_highest_bid: Union[float, int] = 0.0, 
-        final_price: Union[float, int] = 0.0
-    ):
-        if not isinstance(property, Land):
-            raise ValueError("Property must be of type Land.")
-        
-        if successful_bidder is not None and not isinstance(successful_bidder, Person):
-            raise ValueError("Successful bidder must be of type Person or None.")
-        
-        if not isinstance(highest_bid, (float, int)):
-            raise ValueError("Highest bid must be a numeric value.")
-        
-        if not isinstance(second_highest_bid, (float, int)):
-            raise ValueError("Second highest bid must be a numeric value.")
-        
-        if not isinstance(final_price, (float, int)):
-            raise ValueError("Final price must be a numeric value.")
-        
-        self.property = property
-        self.successful_bidder = successful_bidder
-        self.highest_bid = highest_bid
-        self.second_highest_bid = second_highest_bid
-        self.final_price = final_price
+class Allocation(NamedTuple):
+    """Outcome of the auction for one property.
+
+    A lightweight tuple, since one is built for every property sold each
+    step. The fields come from the realtor's typed bid arrays, so they are
+    not type checked here.
+    """
+    property: Land
+    successful_bidder: Person
+    highest_bid: Union[float, int]
+    second_highest_bid: Union[float, int] = 0.0
+    final_price: Union[float, int] = 0.0
 
     def __str__(self):
         return f"Property: {self.property}, Successful Bidder: {self.successful_bidder}, Highest Bid: {self.highest_bid}, Second Highest Bid: {self.second_highest_bid}, Final Price: {self.final_price}"
@@ -0,0 +1,109 @@
+"""Run independent simulations in parallel, one model per process.
+
+Each run is fully determined by its parameters and seed, and runs share
+no state, so they can be spread across processes to sidestep the GIL.
+
+Example::
+
+    grid    = make_param_grid(fixed_parameters, {'density': [100, 300]}, seeds=range(10))
+    results = run_batch(grid)
+
+Each run writes its csv files and run_metadata.yaml to its own subfolder,
+named from its index in the grid and its seed, so runs never share a file.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import random
+
+import yaml
+
+from model.model import City, configure_logging
+
+DEFAULT_BATCH_FOLDER = os.path.join('output_data', 'runs')
+
+
+def _init_worker():
+    """Set up logging and fresh module-level random state in a worker."""
+    # Give each worker its own log file so workers do not truncate each other's logs
+    configure_logging(filename=f'logfile_{os.getpid()}.log')
+    # Forked workers inherit the parent's random state, which is used for run ids
+    random.seed()
+
+
+def get_run_name(index, seed):
+    """Name of a run's subfolder, unique within a batch."""
+    return f'run_{index:04d}_seed_{seed}'
+
+
+def _run_one(indexed_params_and_seed):
+    """Run a single simulation and return its model level output.
+
+    Kept at module top level so it can be pickled and sent to workers.
+
+    :param indexed_params_and_seed: Tuple of (index, (parameters, seed)).
+        ``parameters`` may include ``num_steps`` and ``subfolder``, the
+        batch folder the run's own subfolder is created in; the rest are
+        passed to City.
+    :returns: Tuple of (run_name, run_id, seed, model_out, metadata).
+    """
+    index, (parameters, seed) = indexed_params_and_seed
+    parameters   = dict(parameters)
+    num_steps    = parameters.pop('num_steps', 10)
+    batch_folder = parameters.pop('subfolder', None) or DEFAULT_BATCH_FOLDER
+    run_name     = get_run_name(index, seed)
+
+    city = City(num_steps, seed=seed, subfolder=os.path.join(batch_folder, run_name), **parameters)
+    city.run_model()
+    metadata = {
+        'run_id':                city.run_id,
+        'subfolder':             city.subfolder,
+        'model_description':     city.model_description,
+        'num_steps':             city.num_steps,
+        'simulation_parameters': city.params
+    }
+    return run_name, city.run_id, seed, city.datacollector.get_model_vars_dataframe(), metadata
+
+
+def make_param_grid(fixed_parameters, variable_parameters, seeds=(None,)):
+    """Build (parameters, seed) pairs for every combination of variable parameters.
+
+    :param fixed_parameters: Parameters shared by all runs.
+    :param variable_parameters: Maps parameter names to lists of values to sweep.
+    :param seeds: Seeds to run for each combination.
+    """
+    names = list(variable_parameters)
+    grid  = []
+    for values in itertools.product(*(variable_parameters[name] for name in names)):
+        parameters = {**fixed_parameters, **dict(zip(names, values))}
+        for seed in seeds:
+            grid.append((parameters, seed))
+    return grid
+
+
+def run_batch(param_grid, n_procs=None, metadata_file_path=None):
+    """Run every (parameters, seed) pair in param_grid across a pool of processes.
+
+    Each run writes to its own subfolder, see get_run_name. Once all runs
+    finish, the parent process writes the metadata of every run, keyed by
+    run name, to a single batch metadata file.
+
+    :param param_grid: Iterable of (parameters, seed) pairs, see make_param_grid.
+    :param n_procs: Number of worker processes. Defaults to the number of cores.
+    :param metadata_file_path: Path of the batch metadata file. Defaults to
+        batch_metadata.yaml in the first run's batch folder.
+    :returns: List of (run_name, run_id, seed, model_out) tuples in completion order.
+    """
+    param_grid = list(param_grid)
+    with mp.Pool(n_procs, initializer=_init_worker) as pool:
+        results = list(pool.imap_unordered(_run_one, enumerate(param_grid)))
+
+    if results:
+        if metadata_file_path is None:
+            batch_folder       = param_grid[0][0].get('subfolder') or DEFAULT_BATCH_FOLDER
+            metadata_file_path = os.path.join(batch_folder, 'batch_metadata.yaml')
+        metadata = {run_name: run_metadata for run_name, _, _, _, run_metadata in results}
+        with open(metadata_file_path, 'w') as file:
+            yaml.safe_dump(metadata, file)
+
+    return [result[:4] for result in results]
@@ -0,0 +1,41 @@
+from model._compat import njit
+
+
+@njit(cache=True)
+def _firm_step(N, F, k, wage, A, alpha, beta, gamma,
+               subsistence_wage, overhead, adjw, adjF, adjk,
+               r, price_of_output, mult, seed_population):
+    """Update the firm's output, wage, firm count and capital for one step.
+
+    :param N: Total urban workforce.
+    :param F: Number of firms.
+    :param k: Capital stock.
+    :param wage: Current wage.
+    :returns: Tuple of (agglomeration_population, n, y, MPL, wage_target,
+        wage, wage_premium, F_target, F, y_target, k_target, k).
+    """
+    # GET POPULATION AND OUTPUT
+    agglomeration_population = mult * N + seed_population
+    n = N / F # distribute workforce across firms
+    base = A * agglomeration_population**gamma * k**alpha * n**beta # shared by y and y_target
+    y = base
+
+    # ADJUST WAGE
+    MPL = beta * y / n # marginal value product of labour known to firms
+    wage_target = subsistence_wage + (MPL - subsistence_wage) / (1 + overhead)
+    wage = (1 - adjw) * wage + adjw * wage_target # assume a partial adjustment process
+
+    # FIND POPULATION AT NEW WAGE
+    wage_premium = wage - subsistence_wage # find wage available for transportation
+
+    # ADJUST NUMBER OF FIRMS
+    F_target = F * wage_target/wage # this is completely arbitrary but harmless
+    F = (1 - adjF) * F + adjF * F_target
+
+    # ADJUST CAPITAL STOCK
+    y_target = price_of_output * base
+    k_target = alpha * y_target/r
+    k = (1 - adjk) * k + adjk * k_target
+
+    return (agglomeration_population, n, y, MPL, wage_target,
+            wage, wage_premium, F_target, F, y_target, k_target, k)
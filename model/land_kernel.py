@@ -0,0 +1,25 @@
+from model._compat import njit
+
+
+@njit(cache=True)
+def _record_land_prices(order, land_idx, warranted_price, transport_cost, wage, time_step,
+                        out_warranted_price, out_transport_cost, out_wage, out_time_step):
+    """Record this step's prices for land parcels, writing in place.
+
+    Runs serially: the loop only copies a few values per parcel, and
+    numba's parallel threading layers are not safe when Streamlit steps
+    models from several script threads at once.
+
+    :param order: Rows of the land AgentArray to step.
+    :param land_idx: The _idx column of the land AgentArray.
+    :param warranted_price: Warranted price of every parcel.
+    :param transport_cost: Transport cost of every parcel.
+    :param wage: The firm's current wage.
+    :param time_step: The model's current time step.
+    """
+    for k in range(order.shape[0]):
+        i = land_idx[order[k]]
+        out_warranted_price[i] = warranted_price[i]
+        out_transport_cost[i]  = transport_cost[i]
+        out_wage[i]            = wage
+        out_time_step[i]       = time_step
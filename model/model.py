@@ -6,12 +6,11 @@ import datetime
 import random
 import string
 from typing import Dict, List
+from types import SimpleNamespace
 from contextlib import contextmanager
 # import subprocess
 # import math
 import numpy as np
-import pandas as pd
-from scipy.spatial import distance
 
 from sklearn.linear_model import LinearRegression
 # from sklearn.model_selection import KFold
@@ -26,15 +25,73 @@ from mesa.datacollection import DataCollector
 
 from model.agents import Land, Person, Firm, Investor, Bank, Realtor
 from model.schedule import RandomActivationByBreed
+from model.person_kernel import _person_decisions
+from model.land_kernel import _record_land_prices
+from model._compat import HAS_NUMBA
 
-logging.basicConfig(filename='logfile.log',
-                    filemode='w',
-                    level=logging.DEBUG,
-                    format='%(asctime)s %(name)s %(levelname)s:%(message)s')
 logger = logging.getLogger(__name__)
 
 logging.getLogger('matplotlib').setLevel(logging.ERROR) 
 
+# Per parcel, per step land price record used in forecasting
+PRICE_DATA_DTYPE = np.dtype([('warranted_price', np.float64),
+                             ('transport_cost',  np.float64),
+                             ('wage',            np.float64),
+                             ('time_step',       np.float64)])
+
+def morton_code(x, y):
+    """Position of grid cells along a Morton (Z-order) curve.
+
+    Interleaves the bits of the x and y coordinates, so cells that are
+    close on the grid tend to be close in this order. Works elementwise
+    on arrays of coordinates below 2**16.
+    """
+    def spread_bits(v):
+        v = np.asarray(v, dtype=np.uint32)
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+    return spread_bits(x) | (spread_bits(y) << 1)
+
+def euclidean_distance(a, b):
+    """Euclidean distance between positions, elementwise on arrays."""
+    return np.hypot(a[0] - b[0], a[1] - b[1])
+
+def cityblock_distance(a, b):
+    """Cityblock distance between positions, elementwise on arrays."""
+    return np.abs(a[0] - b[0]) + np.abs(a[1] - b[1])
+
+# Values of the distance_method parameter
+DISTANCE_METHODS = {
+    'euclidean': euclidean_distance,
+    'cityblock': cityblock_distance,
+}
+
+def configure_logging(filename='logfile.log', filemode='w', level=None):
+    """Configure logging for a process running the model.
+
+    Called by entry points and worker processes rather than at import,
+    so parallel workers do not truncate each other's log files.
+
+    By default only warnings and errors are logged, to stderr. Set the
+    HOUSING_APP_LOG environment variable to a level name such as DEBUG,
+    or pass level, to write logs at that level to filename instead.
+    """
+    log_format = '%(asctime)s %(name)s %(levelname)s:%(message)s'
+    level      = level or os.environ.get('HOUSING_APP_LOG')
+    if level is None:
+        logging.basicConfig(level=logging.WARNING, format=log_format)
+        return
+
+    if isinstance(level, str):
+        level = level.upper()
+    logging.basicConfig(filename=filename,
+                        filemode=filemode,
+                        level=level,
+                        format=log_format)
+
 # def capture_rents(model):
 #     """Current rents for each location in the grid."""
 #     rent_grid = []
@@ -72,6 +129,7 @@ class City(Model):
             'width': 50,
             'height': 1,
             'center_city': False,     # Flag for city center in center if True, or bottom corner if False
+            'distance_method': 'euclidean', # Distance to the center, 'euclidean' or 'cityblock'
             'random_init_age': False, # Flag for randomizing initial age. If False, all workers begin at age 0
             'init_city_extent': 10.,  # f CUT OR CHANGE?
             'seed_population': 400,
@@ -138,8 +196,18 @@ class City(Model):
             self.center    = (width//2, height//2)
         else:
             self.center    = (0, 0)
+        # Choose the distance function once rather than on every call
+        try:
+            self._dist_fn = DISTANCE_METHODS[self.params['distance_method']]
+        except KeyError:
+            raise ValueError("Invalid distance calculation method. "
+                             "Supported methods are 'euclidean' and 'cityblock'.") from None
         self.grid = MultiGrid(self.params['width'], self.params['height'], torus=False)
         self.schedule = RandomActivationByBreed(self)
+        if HAS_NUMBA:
+            # Compiled land step, otherwise Land.step_vectorized records prices
+            self.schedule.register_njit_kernel(Land, _record_land_prices, columns=('_idx',),
+                                               args=City.land_price_kernel_args)
         self.transport_cost_per_dist = self.params['init_wage_premium_ratio'] * self.params['subsistence_wage'] / self.params['init_city_extent'] # c
 
         # People
@@ -163,6 +231,15 @@ class City(Model):
         self.workforce = Workforce()
         self.removed_agents = 0
 
+        # Land parcel values are stored as arrays indexed by each parcel's _idx
+        self.n_land              = self.width * self.height
+        self.land_parcels        = []
+        self.land_transport_cost = np.zeros(self.n_land, dtype=np.float64)
+        self.land_tax_rate       = np.zeros(self.n_land, dtype=np.float64)
+        self.warranted_rent_arr  = np.zeros(self.n_land, dtype=np.float64)
+        self.net_rent_arr        = np.zeros(self.n_land, dtype=np.float64)
+        self.warranted_price_arr = np.zeros(self.n_land, dtype=np.float64)
+
         # Add bank, firm, investor, and realtor
         self.unique_id       = 1        
         self.bank            = Bank(self.unique_id, self, self.center, self.r_prime)
@@ -207,13 +284,27 @@ class City(Model):
         self.grid.place_agent(self.realtor, self.center)
         self.schedule.add(self.realtor)
 
+        # Create parcels in Morton order, so parcels that are near each other
+        # on the grid are also near each other in the land arrays
+        positions = [(cell[1], cell[2]) for cell in self.grid.coord_iter()]
+        pos_x     = np.array([pos[0] for pos in positions], dtype=np.int64)
+        pos_y     = np.array([pos[1] for pos in positions], dtype=np.int64)
+        order     = np.argsort(morton_code(pos_x, pos_y), kind='stable')
+        positions = [positions[i] for i in order]
+        pos_x     = pos_x[order]
+        pos_y     = pos_y[order]
+
+        # Compute distances to the center for all cells at once
+        distances = self._dist_fn((pos_x, pos_y), self.center)
+        self.parcel_by_pos = {} # Maps grid position to land array index
+
         # Add land and people to each cell
         self.unique_id      += 1
-        for cell in self.grid.coord_iter():
-            pos              = (cell[1], cell[2])
-
+        for pos, dist in zip(positions, distances):
             land             = Land(self.unique_id, self, pos, 
-                                    self.params['property_tax_rate'])
+                                    self.params['property_tax_rate'],
+                                    distance_from_center = dist)
+            self.parcel_by_pos[pos] = land._idx
             self.grid.place_agent(land, pos)
             self.schedule.add(land)
 
@@ -234,8 +325,15 @@ class City(Model):
 
             self.unique_id  += 1
 
+        self.update_step_cache()
+        self.update_land_values()
         self.setup_data_collection()
 
+    def reset_randomizer(self, seed=None):
+        """Reseed self.random and the scheduler's step order generator."""
+        super().reset_randomizer(seed)
+        self.schedule.reset_randomizer(self._seed)
+
     def step(self):
         """ The model step function runs in each time step when the model
         is executed. It calls the agent functions, then records results
@@ -244,32 +342,29 @@ class City(Model):
 
         self.time_step += 1
 
-        logger.debug(f'Step {self.schedule.steps}.')
-        self.step_price_data.clear()
+        logger.debug('Step %s.', self.schedule.steps)
 
         # Land records locational rents and calculates price forecast
+        self.update_step_cache()
+        self.update_land_values()
         self.schedule.step_breed(Land)
-        new_df = pd.DataFrame(self.step_price_data)
-        self.price_data = pd.concat([self.price_data, new_df], 
-                                          ignore_index=True)
 
         self.price_model = self.get_price_model()
         self.p_dot       = self.get_p_dot()
 
         # Firms update wages
         self.schedule.step_breed(Firm)
+        self.update_step_cache()
+        self.update_land_values()
     
         # People work, retire, and list homes to sell
-        self.schedule.step_breed(Person)
+        self.step_persons()
+
+        # Add agents to replace retiring workers
+        newcomers = [self.create_newcomer() for _ in self.workforce.retiring]
 
-        for i in self.workforce.retiring:
-            # Add agents to replace retiring workers
-            person = self.create_newcomer()
-            # if (person.unique_id in self.workforce.newcomers):
-            #     print('new agent in newcomers')
-            # else:
-            #     print('new agent not in newcomers')
-            person.bid()
+        # Newcomers bid on properties
+        self.realtor.collect_bids_vectorized(newcomers)
 
         # Investors bid on properties
         self.schedule.step_breed(Investor, step_name='bid')
@@ -285,6 +380,108 @@ class City(Model):
 
         self.record_step_data()
 
+    def step_persons(self):
+        """Decide every person's step in one pass, then apply the decisions.
+
+        Decisions only depend on each person's own state and the frozen
+        step cache. Applying them has side effects on the workforce and
+        sale listing, so that still runs one person at a time in random order.
+
+        Working periods are double buffered: decisions read the current
+        ones, the next ones are written to the other buffer, and the swap
+        makes them current before any decision is applied.
+        """
+        arrays         = self.schedule.agent_arrays[Person]
+        rows           = arrays.active_rows()
+        persons        = arrays.agents[rows]
+        working_period = arrays['working_period'][rows]
+        residence_idx  = np.fromiter((-1 if p.residence is None else p.residence._idx
+                                      for p in persons), np.int64, count=len(rows))
+        transport_cost = np.where(residence_idx >= 0,
+                                  self.land_transport_cost[residence_idx], np.inf)
+
+        decisions = _person_decisions(working_period, self.working_periods,
+                                      self._step_cache.wp, transport_cost)
+        arrays.next_columns['working_period'][rows] = working_period + 1
+        self.schedule.swap_breed(Person)
+
+        for person, decision in zip(persons, decisions):
+            person._decision = decision
+        self.schedule.step_breed(Person, step_name='apply_state')
+
+    def update_step_cache(self):
+        """Store model scalars that stay fixed until wages next change.
+
+        Agents read these in their hot paths instead of looking them up
+        on the firm and model for every parcel and bid.
+        """
+        self._step_cache = SimpleNamespace(
+            wp       = self.firm.wage_premium,
+            sw       = self.firm.subsistence_wage,
+            wage     = self.firm.wage,
+            a        = self.housing_services_share,
+            b        = self.maintenance_share,
+            r_prime  = self.r_prime,
+            r_target = self.r_target,
+            T        = self.mortgage_period,
+            delta_T  = self.delta**self.mortgage_period,
+            p_dot    = self.p_dot,
+        )
+
+    def update_land_values(self):
+        """Compute rents and prices for every land parcel in one pass.
+
+        Land properties read from these arrays, so this must be called
+        whenever the firm's wages change.
+        """
+        c                = self._step_cache
+        wage_premium     = c.wp
+        subsistence_wage = c.sw
+        a                = c.a
+        b                = c.b
+        r_prime          = c.r_prime
+        maintenance      = a * b * subsistence_wage
+
+        np.subtract(wage_premium + a * subsistence_wage, self.land_transport_cost,
+                    out=self.warranted_rent_arr)
+        np.divide(self.warranted_rent_arr, r_prime, out=self.warranted_price_arr)
+        # Net rent is warranted rent less maintenance and property tax
+        np.multiply(self.land_tax_rate, self.warranted_price_arr, out=self.net_rent_arr)
+        np.subtract(self.warranted_rent_arr, self.net_rent_arr, out=self.net_rent_arr)
+        self.net_rent_arr -= maintenance
+
+    def record_price_data(self, land_idx=slice(None)):
+        """Record this step's prices for land parcels in one row of step_price_data.
+
+        :param land_idx: Indices of the parcels in the land arrays, default all.
+        """
+        row = self.next_price_data_row()
+        row['warranted_price'][land_idx] = self.warranted_price_arr[land_idx]
+        row['transport_cost'][land_idx]  = self.land_transport_cost[land_idx]
+        row['wage'][land_idx]            = self.firm.wage
+        row['time_step'][land_idx]       = self.time_step
+
+    def land_price_kernel_args(self):
+        """Arguments after the land columns for land_kernel._record_land_prices."""
+        row = self.next_price_data_row()
+        return (self.warranted_price_arr, self.land_transport_cost,
+                self.firm.wage, self.time_step,
+                row['warranted_price'], row['transport_cost'],
+                row['wage'], row['time_step'])
+
+    def next_price_data_row(self):
+        """Returns this step's row of step_price_data, growing it if needed."""
+        t = self.schedule.steps
+        if t >= len(self.step_price_data):
+            # The model was stepped past num_steps, so make room for more steps
+            grown = np.zeros((max(2 * len(self.step_price_data), t + 1), self.n_land),
+                             dtype=PRICE_DATA_DTYPE)
+            grown[:len(self.step_price_data)] = self.step_price_data
+            self.step_price_data = grown
+
+        self.price_data_steps = t + 1
+        return self.step_price_data[t]
+
     def run_model(self):
         for t in range(self.num_steps):
             self.step()
@@ -380,7 +577,7 @@ class City(Model):
             "y":                 lambda a: a.pos[1],
             "distance_from_center": lambda a: getattr(a, "distance_from_center", None) if isinstance(a, Land) else None,
             # "wage":               lambda a: getattr(a, "wage", None) if isinstance(a, Land) else None,
-            "is_working":           lambda a: None if not isinstance(a, Person) else 1 if a.unique_id in a.workforce.workers else 0,
+            "is_working":           lambda a: None if not isinstance(a, Person) else 1 if a.role_flags & Person.WORKER else 0,
             # "is_working":         lambda a: getattr(a, "is_working", None),
             "working_period":    lambda a: getattr(a, "working_period", None),
             # "property_tax_rate":  lambda a: getattr(a, "property_tax_rate", None),
@@ -393,9 +590,9 @@ class City(Model):
                                             agent_reporters = agent_reporters)
 
 
-        self.step_price_data = [] # for forecasting
-        self.price_data = pd.DataFrame(
-             columns=['id', 'warranted_price', 'time_step', 'transport_cost', 'wage'])   
+        # Land price history for forecasting, one row per step and one column per parcel
+        self.step_price_data  = np.zeros((max(self.num_steps, 1), self.n_land), dtype=PRICE_DATA_DTYPE)
+        self.price_data_steps = 0
 
         # Create the 'output_data' subfolder if it doesn't exist
         if not os.path.exists(self.subfolder):
@@ -407,14 +604,16 @@ class City(Model):
         self.model_file_path   = os.path.join(self.subfolder, model_filename)
         self.metadata_file_path = os.path.join(self.subfolder, 'run_metadata.yaml')
 
-        metadata = {
+        self.record_metadata(self.get_metadata(), self.metadata_file_path)
+
+    def get_metadata(self):
+        """Metadata describing this run, as recorded in run_metadata.yaml."""
+        return {
             'model_description':     self.model_description,
             'num_steps':             self.num_steps,
             'simulation_parameters': self.params
         }
 
-        self.record_metadata(metadata, self.metadata_file_path)
-
     def record_metadata(self, metadata, metadata_file_path):
         """Append metadata for each experiment to a metadata file."""
 
@@ -424,7 +623,7 @@ class City(Model):
         # If the file exists, load the existing metadata; otherwise, create an empty dictionary
         if file_exists:
             with open(metadata_file_path, 'r') as file:
-                existing_metadata = yaml.safe_load(file)
+                existing_metadata = yaml.safe_load(file) or {}
         else:
             existing_metadata = {}
 
@@ -440,23 +639,23 @@ class City(Model):
         # TODO: Check only one worker per house and that all workers have a residence
         self.rent_production = sum(
             agent.model.firm.wage_premium for agent in self.schedule.agents_by_breed[Person].values() 
-            if agent.unique_id in agent.workforce.workers
+            if agent.role_flags & Person.WORKER
         )
 
         # TODO  Do we only count amenity for workers, or those in the urban boundary?
         self.rent_amenity    = sum(
             agent.amenity for agent in self.schedule.agents_by_breed[Person].values() 
-            if agent.unique_id in agent.workforce.workers
+            if agent.role_flags & Person.WORKER
         )
 
         self.market_rent = sum(agent.market_rent    for agent in self.schedule.agents_by_breed[Land].values()
-                               if agent.resident and agent.resident.unique_id in agent.resident.workforce.workers)
+                               if agent.resident and agent.resident.role_flags & Person.WORKER)
         self.net_rent    = sum(agent.net_rent       for agent in self.schedule.agents_by_breed[Land].values()
-                               if agent.resident and agent.resident.unique_id in agent.resident.workforce.workers)
+                               if agent.resident and agent.resident.role_flags & Person.WORKER)
         self.potential_dissipated_rent = sum(agent.transport_cost for agent in self.schedule.agents_by_breed[Land].values())
         self.dissipated_rent = sum(
             agent.transport_cost for agent in self.schedule.agents_by_breed[Land].values() 
-            if agent.resident and agent.resident.unique_id in agent.resident.workforce.workers
+            if agent.resident and agent.resident.role_flags & Person.WORKER
         )
         self.available_rent  = self.rent_production + self.rent_amenity - self.dissipated_rent # w - cd + A - total_dissipated # total-captured
         self.rent_captured_by_finance  = 0 # TODO implement. make a marker for agents in the city
@@ -514,7 +713,7 @@ class City(Model):
         return person
 
     def get_distance_to_center(self, pos):
-        return distance.euclidean(pos, self.center)
+        return self._dist_fn(pos, self.center)
 
     # If there were more data
     # def get_price_model(self):
@@ -569,10 +768,13 @@ class City(Model):
     def get_price_model(self):
         # TODO use realized price, not just warranted
         # Independent variables
-        x = self.price_data[['time_step','transport_cost','wage']]
-        # x = self.price_data[['time_step']]
+        price_data = self.step_price_data[:self.price_data_steps].ravel()
+        x = np.column_stack((price_data['time_step'],
+                             price_data['transport_cost'],
+                             price_data['wage']))
+        # x = price_data['time_step'].reshape(-1, 1)
         # Dependent variable
-        y = self.price_data['warranted_price']
+        y = price_data['warranted_price']
 
         # with sklearn
         regr = LinearRegression()
@@ -604,10 +806,22 @@ class Workforce:
     def add(self, agent: Person, agent_dict: dict) -> None:
         if agent.unique_id not in agent_dict:
             agent_dict[agent.unique_id] = agent
+            agent.role_flags |= self.get_role_flag(agent_dict)
 
     def remove(self, agent: Person, agents_dict: Dict[int, Person]) -> None:
         if agent.unique_id in agents_dict:
             del agents_dict[agent.unique_id]
+            agent.role_flags &= ~self.get_role_flag(agents_dict)
+
+    def get_role_flag(self, agents_dict: Dict[int, Person]) -> int:
+        """Returns the Person.role_flags bit matching the dictionary."""
+        if agents_dict is self.workers:
+            return Person.WORKER
+        if agents_dict is self.retiring:
+            return Person.RETIRING
+        if agents_dict is self.newcomers:
+            return Person.NEWCOMER
+        return 0
 
     # def add(self, agent: Person, agent_dict: dict) -> None:
     #     if agent.unique_id in agent_dict:
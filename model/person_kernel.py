@@ -0,0 +1,29 @@
+import numpy as np
+
+from model._compat import njit
+
+# Values of the person decision codes returned by _person_decisions
+DECISION_IDLE   = 0 # Stop working, transport costs exceed the wage premium
+DECISION_WORK   = 1
+DECISION_RETIRE = 2
+
+
+@njit(cache=True)
+def _person_decisions(working_period, working_periods, wage_premium, transport_cost):
+    """Decide whether each person retires, works or stays idle this step.
+
+    Each decision only reads the person's own state and the frozen model
+    scalars, so all people are decided at once.
+
+    :param working_period: Working period of each person before this step.
+    :param working_periods: Working periods before retirement.
+    :param wage_premium: The firm's current wage premium.
+    :param transport_cost: Transport cost of each person's residence.
+    :returns: Array of decision codes, one per person.
+    """
+    retire    = working_period + 1 > working_periods
+    work      = wage_premium > transport_cost
+    decisions = np.full(working_period.shape[0], DECISION_IDLE, np.int8)
+    decisions[work]   = DECISION_WORK
+    decisions[retire] = DECISION_RETIRE
+    return decisions
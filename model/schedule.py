@@ -1,8 +1,128 @@
-from collections import defaultdict
-
+import numpy as np
 from mesa.time import RandomActivation
 
 
+class AgentArray:
+    """Struct of arrays holding one breed's agents.
+
+    Each column named in the breed's soa_columns is a numpy array with one
+    row per agent, filled from the agent's attribute when it is added.
+    Removed agents leave a released row, which agents added after the
+    next reclaim_rows reuse, and active marks the rows in use. id_rows maps each integer unique_id
+    to its row, or -1 if the agent is not in the array. steppers holds each
+    agent's bound step method, looked up once when the agent is added.
+
+    Columns named in buffered also have a next state buffer. Vectorized
+    steps read the current state from columns and write the next state to
+    next_columns, so no agent reads a value another agent has already
+    updated. swap then makes the next state current without copying.
+
+    :param columns: Dictionary of column names and numpy dtypes.
+    :param capacity: Number of rows to allocate at first.
+    :param buffered: Names of the columns with a next state buffer.
+    """
+
+    def __init__(self, columns=None, capacity=64, buffered=()):
+        self.dtypes    = dict(columns or {})
+        self.buffered  = tuple(buffered)
+        self.columns   = {name: np.zeros(capacity, dtype=dtype)
+                          for name, dtype in self.dtypes.items()}
+        self.next_columns = {name: np.zeros(capacity, dtype=self.dtypes[name])
+                             for name in self.buffered}
+        self.agents    = np.empty(capacity, dtype=object)
+        self.steppers  = np.empty(capacity, dtype=object)
+        self.ids       = np.zeros(capacity, dtype=np.int64)
+        self.active    = np.zeros(capacity, dtype=bool)
+        self.id_rows   = np.full(capacity, -1, dtype=np.int64)
+        self.free_rows = []
+        self.released_rows = []  # Freed, but not reusable until reclaim_rows
+        self.n_rows    = 0  # Rows ever used, active or free
+        self.n_active  = 0
+
+    def __len__(self):
+        return self.n_active
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def add(self, agent):
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            row = self.n_rows
+            if row == len(self.active):
+                self._grow(2 * row)
+            self.n_rows += 1
+
+        for name, column in self.columns.items():
+            column[row] = getattr(agent, name)
+        for name, column in self.next_columns.items():
+            column[row] = self.columns[name][row]
+
+        unique_id = agent.unique_id
+        if unique_id >= len(self.id_rows):
+            id_rows = np.full(max(2 * len(self.id_rows), unique_id + 1), -1, dtype=np.int64)
+            id_rows[:len(self.id_rows)] = self.id_rows
+            self.id_rows = id_rows
+        self.id_rows[unique_id] = row
+        self.agents[row]   = agent
+        self.steppers[row] = getattr(agent, 'step', None)
+        self.ids[row]      = unique_id
+        self.active[row] = True
+        self.n_active   += 1
+
+    def remove(self, agent):
+        row = self.id_rows[agent.unique_id]
+        if row < 0:
+            raise KeyError(agent.unique_id)
+        self.id_rows[agent.unique_id] = -1
+        self.agents[row]   = None
+        self.steppers[row] = None
+        self.active[row]   = False
+        self.n_active   -= 1
+        self.released_rows.append(row)
+
+    def active_rows(self):
+        """Returns an array of the rows holding agents."""
+        return np.flatnonzero(self.active[:self.n_rows])
+
+    def reclaim_rows(self):
+        """Let added agents reuse the rows released since the last call.
+
+        The scheduler calls this after each step of the breed, so a row
+        in a step's order never holds an agent added during that step.
+        """
+        self.free_rows.extend(self.released_rows)
+        self.released_rows.clear()
+
+    def row(self, unique_id):
+        """Returns the row of the agent with unique_id, or -1 if it is not in the array."""
+        if unique_id >= len(self.id_rows):
+            return -1
+        return self.id_rows[unique_id]
+
+    def swap(self):
+        """Make the next state current by rebinding the buffered columns."""
+        for name in self.buffered:
+            self.columns[name], self.next_columns[name] = self.next_columns[name], self.columns[name]
+
+    def _grow(self, capacity):
+        for buffers in (self.columns, self.next_columns):
+            for name, column in buffers.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:len(column)] = column
+                buffers[name] = grown
+        for name in ('agents', 'steppers'):
+            column = getattr(self, name)
+            grown  = np.empty(capacity, dtype=object)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+        self.ids    = np.concatenate([self.ids,
+                                      np.zeros(capacity - len(self.ids), dtype=np.int64)])
+        self.active = np.concatenate([self.active,
+                                      np.zeros(capacity - len(self.active), dtype=bool)])
+
+
 class RandomActivationByBreed(RandomActivation):
     """ A scheduler which activates each type of agent once per step, in random
     order, with the order reshuffled every step.
@@ -10,12 +130,38 @@ class RandomActivationByBreed(RandomActivation):
     This is equivalent to the NetLogo 'ask breed...' and is generally the
     default behavior for an ABM.
 
-    Assumes that all agents have a step() method.
+    Assumes that all agents have a step() method. A breed that defines
+    step_vectorized(model, arrays, order) instead has its step run once on
+    its AgentArray, with order a random permutation of the active rows.
+    A kernel added with register_njit_kernel takes precedence over both.
+
+    Breeds with soa_buffered_columns are swapped after each vectorized step,
+    see AgentArray. Breeds with order_independent set to True step their rows
+    in order, without the shuffle, on both the vectorized and per-agent paths.
+    Set it only when each agent's step reads state no other agent of the
+    breed writes during the same step. Row order is not insertion order
+    once rows are reused.
+
+    Agents added while a breed steps are first stepped in its next step.
     """
 
     def __init__(self, model):
         super().__init__(model)
-        self.agents_by_breed = defaultdict(dict)
+        self.agents_by_breed = {}
+        self.breed_counts    = {}
+        self.agent_arrays    = {}
+        self.njit_kernels    = {}
+        self.reset_randomizer(getattr(model, '_seed', None))
+
+    def reset_randomizer(self, seed=None):
+        """Seed the numpy generator that shuffles each breed's step order.
+
+        Seeded like the model's own random, so a seeded model steps its
+        agents in the same order on every run.
+
+        :param seed: Seed for the generator, usually the model's _seed.
+        """
+        self.random_np = np.random.default_rng(seed)
 
     def add(self, agent):
         """ Add an Agent object to the schedule
@@ -24,14 +170,25 @@ class RandomActivationByBreed(RandomActivation):
         """
         self._agents[agent.unique_id] = agent
         agent_class = type(agent)
-        self.agents_by_breed[agent_class][agent.unique_id] = agent
+        self.agents_by_breed.setdefault(agent_class, {})[agent.unique_id] = agent
+        if agent_class not in self.agent_arrays:
+            self.agent_arrays[agent_class] = AgentArray(
+                getattr(agent_class, 'soa_columns', None),
+                buffered=getattr(agent_class, 'soa_buffered_columns', ()))
+        self.agent_arrays[agent_class].add(agent)
+        self.breed_counts[agent_class] = self.breed_counts.get(agent_class, 0) + 1
 
     def remove(self, agent):
         """ Remove all instances of a given agent from the schedule."""
-        del self._agents[agent.unique_id]
-
         agent_class = type(agent)
-        del self.agents_by_breed[agent_class][agent.unique_id]
+        try:
+            del self.agents_by_breed[agent_class][agent.unique_id]
+        except KeyError:
+            raise KeyError("Agent %s of breed %s is not in the schedule."
+                           % (agent.unique_id, agent_class.__name__)) from None
+        del self._agents[agent.unique_id]
+        self.agent_arrays[agent_class].remove(agent)
+        self.breed_counts[agent_class] -= 1
 
     def step(self, by_breed=True):
         """Executes the step of each agent breed, one at a time, in random order.
@@ -52,21 +209,84 @@ class RandomActivationByBreed(RandomActivation):
         self.steps += 1
         self.time += 1
 
+    def register_njit_kernel(self, breed, kernel_fn, columns=(), args=None):
+        """Run a compiled kernel in place of a breed's step.
+
+        The kernel is called as
+        kernel_fn(order, *columns, *args(model)), where order is a
+        permutation of the breed's active rows and columns are the named
+        AgentArray columns. It writes its results back in place.
+
+        :param breed: Class object of the breed the kernel steps.
+        :param kernel_fn: A numba.njit function, see model._compat.
+        :param columns: Names of the breed's soa_columns passed to the kernel.
+        :param args: Callable taking the model and returning a tuple of any
+                     further kernel arguments, called every step.
+        """
+        self.njit_kernels[breed] = (kernel_fn, tuple(columns), args)
+
+    def swap_breed(self, breed):
+        """Make a breed's next state current, see AgentArray.swap."""
+        self.agent_arrays[breed].swap()
+
     def step_breed(self, breed, step_name='step'):
         """Shuffle order and run all agents of a given breed.
 
         :param breed: Class object of the breed to run.
         :param step: The name of the step function, default is `step`. Useful for staged activation. 
         """
-        agent_keys = list(self.agents_by_breed[breed].keys())
-        self.model.random.shuffle(agent_keys)
-        for agent_key in agent_keys:
-            getattr(self.agents_by_breed[breed][agent_key], step_name)()
+        arrays = self.agent_arrays.get(breed)
+        if arrays is None:
+            return
+
+        kernel          = self.njit_kernels.get(breed)
+        step_vectorized = getattr(breed, 'step_vectorized', None)
+        if step_name == 'step' and (kernel is not None or step_vectorized is not None):
+            order = arrays.active_rows()
+            if not getattr(breed, 'order_independent', False):
+                order = order[self.random_np.permutation(len(order))]
+            if kernel is not None:
+                kernel_fn, columns, args = kernel
+                extra_args = args(self.model) if args is not None else ()
+                kernel_fn(order, *(arrays[name] for name in columns), *extra_args)
+            else:
+                step_vectorized(self.model, arrays, order)
+            if arrays.buffered:
+                self.swap_breed(breed)
+            arrays.reclaim_rows()
+            return
+
+        # Shuffle the active rows in place, then step each agent in turn
+        order = arrays.active_rows()
+        if not getattr(breed, 'order_independent', False):
+            self.random_np.shuffle(order)
+        # Rows of agents removed earlier in this step hold None. Agents added
+        # during the step get rows outside order, so they first step next time
+        if step_name == 'step':
+            steppers = arrays.steppers
+            for row in order.tolist():
+                step = steppers[row]
+                if step is not None:
+                    step()
+        else:
+            agents = arrays.agents
+            for row in order.tolist():
+                agent = agents[row]
+                if agent is not None:
+                    getattr(agent, step_name)()
+        arrays.reclaim_rows()
 
     def get_breed_count(self, breed_class):
         """Returns the current number of agents of certain breed in the queue."""
-        return len(self.agents_by_breed[breed_class].values())
+        return self.breed_counts.get(breed_class, 0)
+
+    def get_breed_ids(self, breed_class):
+        """Returns an array of the unique_ids of the breed_class, in row order."""
+        arrays = self.agent_arrays.get(breed_class)
+        if arrays is None:
+            return np.empty(0, dtype=np.int64)
+        return arrays.ids[arrays.active_rows()]
 
     def get_breed_agents(self, breed_class):
         """Returns a list with all elements of the breed_class."""
-        return list(self.agents_by_breed[breed_class].values())
\ No newline at end of file
+        return list(self.agents_by_breed.get(breed_class, {}).values())
\ No newline at end of file
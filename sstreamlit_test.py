@@ -23,11 +23,12 @@ def get_batch_run_keys(folder_path):
 
     return keys
 
+@st.cache_data(ttl=3600)
 def load_data(run_id, folder_path):
     model_file = os.path.join(folder_path, f"{run_id}_model.csv")
 
     if os.path.exists(model_file):
-        model_data = pd.read_csv(model_file)
+        model_data = pd.read_csv(model_file, engine="pyarrow", dtype_backend="pyarrow")
         return model_data
     else:
         st.error(f"Data file not found for run ID: {run_id}")
@@ -45,6 +46,7 @@ def plot_data(data, label=None, variable_parameters=None):
 
     st.pyplot()
 
+@st.cache_data(ttl=3600)
 def load_metadata(folder_path):
     metadata_file = os.path.join(folder_path, "run_metadata.yaml")
 
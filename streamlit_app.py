@@ -1,141 +1,188 @@
 import os
 import subprocess
+import threading
+from collections import namedtuple
 import yaml
 import numpy as np
 import pandas as pd
+import altair as alt
 import streamlit as st
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
-from   plotly.subplots import make_subplots
+import plotly.io as pio
+
+from model.model import City, configure_logging
+
+configure_logging()
+
+# Encode figures with orjson, which serializes the numpy heatmap frames
+# natively, falling back to the json module if it is not installed
+try:
+    pio.json.config.default_engine = "orjson"
+except ValueError:
+    pass
+
+SimulationOutput = namedtuple('SimulationOutput', ['agent_out', 'model_out'])
+CityRun          = namedtuple('CityRun', ['city', 'lock'])
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_city(parameter_items, _num_steps):
+    """Shared model for a parameter set, keyed without the number of steps.
+
+    The model is built for the number of steps first asked for, which the
+    leading underscore leaves out of the cache key. The lock serializes
+    sessions that advance the same model.
+    """
+    return CityRun(City(_num_steps, **dict(parameter_items)), threading.Lock())
+
+@st.cache_data(persist="disk", max_entries=32, show_spinner="Running housing model...")
+def simulate(num_steps, parameter_items):
+    """Run the model, with parameters as sorted (name, value) pairs so they hash cheaply.
+
+    Only the steps the shared model has not yet run are stepped, and output
+    for fewer steps is cut from a longer run. Results are persisted to
+    disk, under ~/.streamlit/cache, so they survive server restarts.
+    """
+    city, lock = get_city(parameter_items, num_steps)
+    with lock:
+        for _ in range(num_steps - city.schedule.steps):
+            city.step()
+        city.record_run_data_to_file()
+        # Keep the recorded number of steps in line with the saved output
+        if city.schedule.steps > city.num_steps:
+            city.num_steps = city.schedule.steps
+            city.record_metadata(city.get_metadata(), city.metadata_file_path)
+
+        # Get output data
+        agent_out = city.datacollector.get_agent_vars_dataframe()
+        model_out = city.datacollector.get_model_vars_dataframe()
+
+    if city.schedule.steps > num_steps:
+        agent_out = agent_out[agent_out.index.get_level_values('Step') <= num_steps]
+        model_out = model_out.iloc[:num_steps]
+    return agent_out, model_out
 
-from model.model import City
+@st.cache_resource(max_entries=8, show_spinner=False)
+def run_simulation(num_steps, parameter_items):
+    """Shared simulation output, returned without copying on reruns.
 
-@st.cache_data()
-def run_simulation(num_steps, parameters):
-    city = City(num_steps, **parameters)
-    city.run_model()
+    Callers must not modify the returned DataFrames.
+    """
+    return SimulationOutput(*simulate(num_steps, parameter_items))
 
-    # Get output data
-    agent_out = city.datacollector.get_agent_vars_dataframe()
-    model_out = city.datacollector.get_model_vars_dataframe()
-    return agent_out, model_out
+def hash_dataframe(df):
+    """Hash every row of a DataFrame, for the figure caches."""
+    return pd.util.hash_pandas_object(df, index=True).values.tobytes()
 
-@st.cache_data()
-def plot_agent_heatmap(df, selected_variable):
+@st.cache_resource(max_entries=8, hash_funcs={pd.DataFrame: hash_dataframe})
+def _build_plotly_figure(df, selected_variable):
+    """Build the animated heatmap of an agent variable over time steps."""
     # Define the color scale limits based on the minimum and maximum value of the selected variable
-    z_min = df[selected_variable].min()
-    z_max = df[selected_variable].max()
-
-    # Create a list of figures for each time step
-    figs = []
-    for time_step in df['time_step'].unique():
-        temp_df = df[df['time_step'] == time_step]
-        hover_text = f"{selected_variable}: " + temp_df[selected_variable].astype(str) + '<br>ID: ' + temp_df['id'].astype(str)
-        fig = go.Figure(data=go.Heatmap(
-            z=temp_df[selected_variable],
-            x=temp_df['x'],
-            y=temp_df['y'],
-            hovertext=hover_text,
+    z_min = float(df[selected_variable].min())
+    z_max = float(df[selected_variable].max())
+
+    # Pivot all rows once into dense (time step, y, x) grids of values and agent ids
+    step_index, _ = pd.factorize(df['time_step'], sort=False)
+    x             = df['x'].to_numpy()
+    y             = df['y'].to_numpy()
+    shape         = (step_index.max() + 1, y.max() + 1, x.max() + 1)
+    grid          = np.full(shape, np.nan, dtype=np.float32)
+    grid[step_index, y, x] = df[selected_variable].to_numpy(dtype=np.float32)
+    id_grid       = np.full(shape, -1, dtype=np.int32)
+    id_grid[step_index, y, x] = df['id'].to_numpy()
+
+    # Create one frame for each time step
+    frames = [go.Frame(data=[go.Heatmap(z=grid[i], customdata=id_grid[i])], name=str(i))
+              for i in range(len(grid))]
+
+    # Show the first time step in a single trace, later steps only update it through the frames
+    final_fig = go.Figure(
+        data=[go.Heatmap(
+            frames[0].data[0],
+            x=np.arange(shape[2]),
+            y=np.arange(shape[1]),
+            # The browser formats the hover text from the values and ids
+            hovertemplate=f"{selected_variable}: %{{z}}<br>ID: %{{customdata}}<br>x: %{{x}}, y: %{{y}}<extra></extra>",
+            hoverongaps=False,
             colorscale='viridis',
             zmin=z_min,
             zmax=z_max,
-            colorbar=dict(title=selected_variable, titleside='right')
-        ))
-        fig.update_layout(title=f'Time Step: {time_step}', xaxis_nticks=20, yaxis_nticks=20)
-        figs.append(fig)
-
-    # Use subplot to add a slider through each time step
-    final_fig = make_subplots(rows=1, cols=1)
-
-    # Add traces from each figure to the final figure
-    for i, fig in enumerate(figs, start=1):
-        for trace in fig.data:
-            final_fig.add_trace(
-                go.Heatmap(
-                    z=trace['z'],
-                    x=trace['x'],
-                    y=trace['y'],
-                    hovertext=trace['hovertext'],
-                    colorscale=trace['colorscale'],
-                    zmin=z_min,
-                    zmax=z_max,
-                    colorbar=trace.colorbar,
-                    visible=(i==1)  # only the first trace is visible
-                ),
-                row=1,
-                col=1  # add the trace to the first subplot
-            )
-
-    # Create frames for each time step
-    final_fig.frames = [go.Frame(data=[figs[i].data[0]], name=str(i)) for i in range(len(figs))]
-
-    # Create a slider to navigate through each time step
-    steps = [dict(label=str(i), method="animate", args=[[str(i)], dict(frame=dict(duration=300, redraw=True))]) for i in range(len(figs))]
+            colorbar=dict(title=dict(text=selected_variable, side='right'))
+        )],
+        frames=frames
+    )
+
+    # Create a play button and a slider to navigate through each time step
+    frame_args = dict(frame=dict(duration=300, redraw=True))
+    updatemenus = [dict(type="buttons", showactive=False, x=0, y=0, xanchor="right", yanchor="top", pad={"t": 50, "r": 10},
+                        buttons=[dict(label="Play", method="animate", args=[None, dict(frame_args, fromcurrent=True)])])]
+    steps = [dict(label=str(i), method="animate", args=[[str(i)], frame_args]) for i in range(len(frames))]
     sliders = [dict(active=0, pad={"t": 50}, steps=steps)]
 
-    final_fig.update_layout(height=600, width=800, sliders=sliders)
+    final_fig.update_layout(height=600, width=800, sliders=sliders, updatemenus=updatemenus)
     # final_fig.update_layout(height=600, width=800, title_text=f"{selected_variable} Heatmap Over Time Steps", sliders=sliders)
+    return final_fig
 
-    # Show the plot in Streamlit
-    st.plotly_chart(final_fig)
+def downcast_agent_data(df, variables):
+    """Cast agent data to the precision the heatmaps need, to halve its size."""
+    dtypes = dict.fromkeys(variables, 'float32')
+    dtypes.update({'x': 'int16', 'y': 'int16', 'id': 'int32'})
+    return df.astype(dtypes)
 
-@st.cache_data()
+@st.cache_data(hash_funcs={pd.DataFrame: hash_dataframe})
 def plot_model_data(model_out):
-    workers = np.array(model_out['workers'])
-    wage = np.array(model_out['wage'])
-    city_extent_calc = np.array(model_out['city_extent_calc'])
-    time = np.arange(len(workers))
-
-    # Set up the figure and axes
-    fig, axes = plt.subplots(3, 2, figsize=(10, 15))
-    fig.suptitle('Model Output', fontsize=16)
-    
-    # New plot 1L: evolution of the wage  
-    axes[0, 0].plot(time, wage, color='red')
-    # axes[0, 0].set_title('City Extent and Wage (Rises)')
-    axes[0, 0].set_title('Evolution of the Wage (Rises)')  
-    axes[0, 0].set_xlabel('Time')
-    axes[0, 0].set_ylabel('Wage')
-    axes[0, 0].grid(True)
-
-    # New plot 3L: evolution of the city extent = l?
-    axes[0,1].plot(time, city_extent_calc, color='red')
-    axes[0,1].set_title('Evolution of the City Extent (Rises)')
-    axes[0,1].set_xlabel('Time')
-    axes[0,1].set_ylabel('City Extent')
-    axes[0,1].grid(True)
-
-    # New plot 2R:  evolution of the workforce
-    axes[1, 0].plot(time, workers, color='purple') 
-    axes[1, 0].set_title('Evolution of the Workforce (Rises)')
-    axes[1, 0].set_xlabel('Time')
-    axes[1, 0].set_ylabel('Workers')
-    axes[1, 0].grid(True)
-
-    # Plot 2L: city extent and workforce  
-    axes[1, 1].plot(city_extent_calc, workers, color='magenta')
-    axes[1, 1].set_title('City Extent and Workforce (Curves Up)')
-    axes[1, 1].set_xlabel('City Extent')
-    axes[1, 1].set_ylabel('Workers')
-    axes[1, 1].grid(True)              
-    
-    # New plot 3L: city extent and wage
-    axes[2, 0].plot(time, city_extent_calc, color='red')
-    # axes[2, 0].set_title('City Extent and Wage (Linear)')
-    axes[2, 0].set_title('City Extent and Wage (Curves Up)')
-    axes[2, 0].set_xlabel('Wage')
-    axes[2, 0].set_ylabel('City Extent')
-    axes[2, 0].grid(True)
-
-    # New plot 1R: workforce response to wage
-    axes[2, 1].plot(wage, workers, color='purple')
-    axes[2, 1].set_title('Workforce Response to Wage')
-    axes[2, 1].set_xlabel('Wage')
-    axes[2, 1].set_ylabel('Workers')
-    axes[2, 1].grid(True)
-    
-    plt.tight_layout()
-    st.pyplot(fig)
+    """Draw the model output as native line charts, rendered in the browser."""
+    chart_data = pd.DataFrame({
+        'Time':        model_out.index.to_numpy(), # The data collector indexes model rows by step
+        'Wage':        model_out['wage'].to_numpy(dtype=np.float32),
+        'City Extent': model_out['city_extent_calc'].to_numpy(dtype=np.float32),
+        'Workers':     model_out['workers'].to_numpy(dtype=np.float32),
+    })
+
+    # Title, x and y columns, and color of each chart, in a 3x2 layout
+    charts = [
+        ('Evolution of the Wage (Rises)',         'Time',        'Wage',        '#ff0000'),
+        ('Evolution of the City Extent (Rises)',  'Time',        'City Extent', '#ff0000'),
+        ('Evolution of the Workforce (Rises)',    'Time',        'Workers',     '#800080'),
+        ('City Extent and Workforce (Curves Up)', 'City Extent', 'Workers',     '#ff00ff'),
+        ('City Extent and Wage (Curves Up)',      'Wage',        'City Extent', '#ff0000'),
+        ('Workforce Response to Wage',            'Wage',        'Workers',     '#800080'),
+    ]
+    columns = st.columns(2)
+    for i, (title, x, y, color) in enumerate(charts):
+        with columns[i % 2]:
+            st.caption(title)
+            if x == 'Time':
+                st.line_chart(chart_data, x=x, y=y, color=color)
+            else:
+                # Join the points of a curve in time order, not sorted by x
+                chart = alt.Chart(chart_data).mark_line(point=True, color=color).encode(
+                    x=alt.X(x, scale=alt.Scale(zero=False)),
+                    y=alt.Y(y, scale=alt.Scale(zero=False)),
+                    order='Time',
+                    tooltip=['Time', x, y],
+                )
+                st.altair_chart(chart)
+
+@st.fragment
+def plot_agent_data(agent_out, agent_type, default_variable):
+    """Heatmap of one agent type's variables.
+
+    Runs as a fragment, so choosing another variable only reruns this section.
+    """
+    df = agent_out.query(f"agent_type == '{agent_type}'")
+    df = df.dropna(axis=1, how='all').reset_index(drop=True)
+    df = df.reset_index(drop=True)
+
+    # Get the list of available variables in the DataFrame
+    available_variables = [col for col in df.columns if col not in ['time_step', 'agent_class', 'agent_type', 'id', 'x', 'y']]
+    df = downcast_agent_data(df, available_variables)
+
+    # Create a dropdown menu to select the variable
+    selected_variable = st.selectbox("Select variable to plot", available_variables, index=available_variables.index(default_variable))
+
+    # Plot the selected variable on the heatmap
+    st.plotly_chart(_build_plotly_figure(df, selected_variable))
 
 def plot_batch_run_data():
     batch_run_folders = get_batch_run_folders()
@@ -164,17 +211,19 @@ def plot_batch_run_data():
         st.set_option('deprecation.showPyplotGlobalUse', False)
         st.pyplot(fig)
 
+@st.cache_data(ttl=3600)
 def load_run_data(run_id, folder_path):
     agent_file = os.path.join(folder_path, f"{run_id}_agent.csv")
     model_file = os.path.join(folder_path, f"{run_id}_model.csv")
 
     if os.path.exists(agent_file) and os.path.exists(model_file):
-        agent_out = pd.read_csv(agent_file)
-        model_out = pd.read_csv(model_file)
+        agent_out = pd.read_csv(agent_file, engine="pyarrow", dtype_backend="pyarrow")
+        model_out = pd.read_csv(model_file, engine="pyarrow", dtype_backend="pyarrow")
         return agent_out, model_out
     else:
         return None, None
 
+@st.cache_data(ttl=3600)
 def load_metadata(folder_path, file_path = "run_metadata.yaml"):
     metadata_file = os.path.join(folder_path, file_path)
 
@@ -186,16 +235,11 @@ def load_metadata(folder_path, file_path = "run_metadata.yaml"):
         st.warning("Metadata file not found.")
         return None
 
+@st.cache_data(ttl=30)
 def get_run_ids(folder_path):
-    file_names = os.listdir(folder_path)
-    run_ids    = set()
-
-    for file_name in file_names:
-        if file_name.endswith("_agent.csv"):
-            run_id = file_name.replace("_agent.csv", "")
-            run_ids.add(run_id)
-
-    return list(run_ids)
+    suffix = "_agent.csv"
+    with os.scandir(folder_path) as entries:
+        return list({entry.name[:-len(suffix)] for entry in entries if entry.name.endswith(suffix)})
 
 def get_batch_run_folders():
     output_data_folder = "output_data"
@@ -231,41 +275,18 @@ def main():
         'density':          st.sidebar.slider("Density", min_value=100, max_value=500, value=300)
     }
 
-    agent_out, model_out = run_simulation(num_steps, parameters) # num_steps, subsistence_wage, working_periods, savings_rate, r_prime)
+    agent_out, model_out = run_simulation(num_steps, tuple(sorted(parameters.items()))) # num_steps, subsistence_wage, working_periods, savings_rate, r_prime)
     
     st.title("Housing Market Model")
     st.header("Model")
     plot_model_data(model_out)
 
-    # Plot heat map for people data
+    # Plot heat maps for people and land data
     st.header("People")
-    df = agent_out.query("agent_type == 'Person'")
-    df = df.dropna(axis=1, how='all').reset_index(drop=True)
-    df = df.reset_index(drop=True)
-
-    # Get the list of available variables in the DataFrame
-    available_variables = [col for col in df.columns if col not in ['time_step', 'agent_class', 'agent_type', 'id', 'x', 'y']]
-
-    # Create a dropdown menu to select the variable
-    selected_variable = st.selectbox("Select variable to plot", available_variables, index=available_variables.index('is_working'))
-
-    # Plot the selected variable on the heatmap
-    plot_agent_heatmap(df, selected_variable)
+    plot_agent_data(agent_out, 'Person', 'is_working')
 
-    # Plot heat map for land data
     st.header("Land")
-    df = agent_out.query("agent_type == 'Land'")
-    df = df.dropna(axis=1, how='all').reset_index(drop=True)
-    df = df.reset_index(drop=True)
-
-    # Get the list of available variables in the DataFrame
-    available_variables = [col for col in df.columns if col not in ['time_step', 'agent_class', 'agent_type', 'id', 'x', 'y']]
-
-    # Create a dropdown menu to select the variable
-    selected_variable = st.selectbox("Select variable to plot", available_variables, index=available_variables.index('warranted_price'))
-
-    # Plot the selected variable on the heatmap
-    plot_agent_heatmap(df, selected_variable)
+    plot_agent_data(agent_out, 'Land', 'warranted_price')
 
     st.markdown("---")
 
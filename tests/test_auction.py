@@ -1,34 +1,91 @@
-# from model.agents import Realtor, Bid, Allocation
-
-# def test_sell_homes():
-#     realtor = Realtor()
-
-#     # Create some bids
-#     bid1 = Bid("Bidder1", "Property1", 100)
-#     bid2 = Bid("Bidder2", "Property1", 150)
-#     bid3 = Bid("Bidder3", "Property2", 200)
-#     bid4 = Bid("Bidder4", "Property2", 180)
-
-#     # Add the bids to the realtor
-#     realtor.add_bid(bid1)
-#     realtor.add_bid(bid2)
-#     realtor.add_bid(bid3)
-#     realtor.add_bid(bid4)
-
-#     # Sell homes and get the allocations
-#     allocations = realtor.sell_homes()
-
-#     # Check the allocations
-#     assert len(allocations) == 2
-
-#     allocation1 = allocations[0]
-#     assert allocation1.property == "Property1"
-#     assert allocation1.successful_bidder == "Bidder2"
-#     assert allocation1.bid_price == 150
-#     assert allocation1.final_price == 100
-
-#     allocation2 = allocations[1]
-#     assert allocation2.property == "Property2"
-#     assert allocation2.successful_bidder == "Bidder3"
-#     assert allocation2.bid_price == 200
-#     assert allocation2.final_price == 180
\ No newline at end of file
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from model.agents import Realtor
+
+
+@pytest.fixture
+def realtor(monkeypatch):
+    """A realtor on a stub model, with bidders and properties named by index."""
+    # Only the auction is tested here, not the transfer of property
+    monkeypatch.setattr(Realtor, 'complete_transactions', lambda self, allocations: None)
+    model = SimpleNamespace(
+        n_land       = 4,
+        workforce    = None,
+        schedule     = SimpleNamespace(_agents={i: f'Bidder{i}' for i in range(200)}),
+        land_parcels = [f'Property{i}' for i in range(4)],
+    )
+    return Realtor(0, model, (0, 0))
+
+def add_bids(realtor, bids):
+    """Add (bidder, property, price) bids to the realtor's bid book."""
+    bidder_ids, property_idxs, prices = zip(*bids)
+    realtor.add_bids(np.array(bidder_ids), np.array(property_idxs), np.array(prices, dtype=float))
+
+def test_highest_bid_wins(realtor):
+    add_bids(realtor, [(1, 1, 100), (2, 1, 150), (3, 2, 200), (4, 2, 180)])
+
+    allocations = realtor.sell_homes()
+
+    assert len(allocations) == 2
+
+    allocation1 = allocations[0]
+    assert allocation1.property == 'Property1'
+    assert allocation1.successful_bidder == 'Bidder2'
+    assert allocation1.highest_bid == 150
+    assert allocation1.second_highest_bid == 100
+
+    allocation2 = allocations[1]
+    assert allocation2.property == 'Property2'
+    assert allocation2.successful_bidder == 'Bidder3'
+    assert allocation2.highest_bid == 200
+    assert allocation2.second_highest_bid == 180
+
+def test_tied_bids_go_to_earliest_bid(realtor):
+    add_bids(realtor, [(5, 0, 100), (6, 0, 150), (7, 0, 150)])
+
+    allocation, = realtor.sell_homes()
+
+    assert allocation.successful_bidder  == 'Bidder6'
+    assert allocation.highest_bid        == 150
+    assert allocation.second_highest_bid == 150
+
+def test_single_bid_has_no_second_highest_bid(realtor):
+    add_bids(realtor, [(5, 3, 120)])
+
+    allocation, = realtor.sell_homes()
+
+    assert allocation.successful_bidder  == 'Bidder5'
+    assert allocation.highest_bid        == 120
+    assert allocation.second_highest_bid == 0
+
+def test_properties_sold_in_order_of_first_bid(realtor):
+    add_bids(realtor, [(1, 3, 100), (2, 0, 100), (3, 3, 110), (4, 1, 100), (5, 0, 90)])
+
+    allocations = realtor.sell_homes()
+
+    assert [a.property for a in allocations] == ['Property3', 'Property0', 'Property1']
+    assert [a.successful_bidder for a in allocations] == ['Bidder3', 'Bidder2', 'Bidder4']
+
+def test_bid_buffers_grow_past_initial_capacity(realtor):
+    initial_capacity = len(realtor._bid_price_buf)
+    n_bids           = 3 * initial_capacity
+    bids             = [(i, i % 4, float(i)) for i in range(n_bids)]
+    # Add the bids in several batches, so the buffers grow while holding bids
+    for start in range(0, n_bids, 50):
+        add_bids(realtor, bids[start:start + 50])
+
+    assert len(realtor._bid_price_buf) >= n_bids
+
+    allocations = realtor.sell_homes()
+
+    # Each property's last two bids are its highest
+    assert [a.property for a in allocations] == [f'Property{i}' for i in range(4)]
+    for i, allocation in enumerate(allocations):
+        last = n_bids - 4 + i
+        assert allocation.successful_bidder  == f'Bidder{last}'
+        assert allocation.highest_bid        == last
+        assert allocation.second_highest_bid == last - 4
+    assert realtor._n_bids == 0
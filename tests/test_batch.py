@@ -0,0 +1,48 @@
+import os
+
+import pytest
+import yaml
+
+from model.batch import get_run_name, make_param_grid, run_batch
+
+
+@pytest.fixture(autouse=True)
+def run_in_tmp_path(tmp_path, monkeypatch):
+    """Write the runs' output and log files to a temporary folder."""
+    monkeypatch.chdir(tmp_path)
+
+def test_make_param_grid_covers_every_combination():
+    grid = make_param_grid({'width': 5, 'density': 1},
+                           {'density': [100, 300], 'gamma': [0.01, 0.02]},
+                           seeds=[7, 8])
+
+    assert len(grid) == 8
+    assert all(parameters['width'] == 5 for parameters, _ in grid)
+    assert [(parameters['density'], parameters['gamma'], seed) for parameters, seed in grid] == [
+        (density, gamma, seed) for density in [100, 300] for gamma in [0.01, 0.02] for seed in [7, 8]]
+
+def test_run_batch_writes_each_run_to_its_own_subfolder(tmp_path):
+    batch_folder = os.path.join(tmp_path, 'batch')
+    # The shared timestamp used to give runs colliding file names
+    fixed_parameters = {'width': 5, 'height': 1, 'num_steps': 2,
+                        'timestamp': 'fixed', 'subfolder': batch_folder}
+    grid    = make_param_grid(fixed_parameters, {'density': [100, 300]}, seeds=[1, 2])
+    results = run_batch(grid, n_procs=2)
+
+    run_names = sorted(run_name for run_name, _, _, _ in results)
+    assert run_names == [get_run_name(index, seed) for index, seed in enumerate([1, 2, 1, 2])]
+    for run_name, run_id, seed, model_out in results:
+        assert len(model_out) == 2
+        files = os.listdir(os.path.join(batch_folder, run_name))
+        assert sorted(files) == sorted([run_id + '_agent.csv', run_id + '_model.csv',
+                                        'run_metadata.yaml'])
+
+    with open(os.path.join(batch_folder, 'batch_metadata.yaml')) as file:
+        metadata = yaml.safe_load(file)
+    assert sorted(metadata) == run_names
+    for run_name, run_id, seed, _ in results:
+        run_metadata = metadata[run_name]
+        assert run_metadata['run_id']    == run_id
+        assert run_metadata['num_steps'] == 2
+        assert run_metadata['subfolder'] == os.path.join(batch_folder, run_name)
+        assert run_metadata['simulation_parameters']['seed'] == seed
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from model.agents import Person
+from model.model import City, morton_code
+
+
+@pytest.fixture(autouse=True)
+def run_in_tmp_path(tmp_path, monkeypatch):
+    """Write the model's output files to a temporary folder."""
+    monkeypatch.chdir(tmp_path)
+
+def make_city(seed=1, **parameters):
+    """A small city whose people retire within a few steps."""
+    parameters = {'width': 6, 'height': 5, 'random_init_age': True, 'working_periods': 4,
+                  **parameters}
+    return City(5, seed=seed, **parameters)
+
+def test_morton_code_interleaves_bits():
+    x = np.array([0, 1, 0, 1, 2, 3, 0, 2])
+    y = np.array([0, 0, 1, 1, 0, 0, 2, 2])
+
+    assert list(morton_code(x, y)) == [0, 1, 2, 3, 4, 5, 8, 12]
+
+def test_parcels_are_created_in_morton_order():
+    city = make_city()
+
+    positions = [parcel.pos for parcel in city.land_parcels]
+    codes     = morton_code(*np.array(positions).T)
+    assert len(positions) == city.width * city.height
+    assert list(codes) == sorted(codes)
+
+def test_parcel_by_pos_matches_land_parcels():
+    city = make_city()
+
+    assert len(city.parcel_by_pos) == city.n_land
+    for pos, idx in city.parcel_by_pos.items():
+        parcel = city.land_parcels[idx]
+        assert parcel.pos  == pos
+        assert parcel._idx == idx
+        assert parcel in city.grid.get_cell_list_contents([pos])
+
+def test_workforce_keeps_role_flags_in_sync():
+    city      = make_city()
+    workforce = city.workforce
+    person    = city.create_newcomer()
+    assert person.role_flags == Person.NEWCOMER
+
+    workforce.add(person, workforce.workers)
+    workforce.add(person, workforce.workers)
+    assert person.role_flags == Person.NEWCOMER | Person.WORKER
+
+    workforce.remove(person, workforce.newcomers)
+    assert person.role_flags == Person.WORKER
+
+    workforce.add(person, workforce.retiring)
+    workforce.remove_from_all(person)
+    assert person.role_flags == 0
+    assert person.unique_id not in workforce.workers
+    assert person.unique_id not in workforce.retiring
+
+def test_working_period_is_stored_in_the_schedule():
+    city   = make_city()
+    person = city.schedule.get_breed_agents(Person)[0]
+    arrays = city.schedule.agent_arrays[Person]
+
+    assert person.working_period == person.init_working_period
+    person.working_period += 1
+    assert arrays['working_period'][arrays.row(person.unique_id)] == person.init_working_period + 1
+
+def person_state(city):
+    """Each person's working period, decision and roles, and the homes for sale."""
+    persons = {person.unique_id: (int(person.working_period), int(person._decision), person.role_flags)
+               for person in city.schedule.get_breed_agents(Person)}
+    listing = sorted(parcel.unique_id for parcel in city.realtor.sale_listing)
+    return persons, listing
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_step_persons_matches_person_step(seed):
+    """City.step_persons gives the same result as stepping each person in turn."""
+    states = []
+    for vectorized in (True, False):
+        city = make_city(seed)
+        for _ in range(2):
+            city.step()
+
+        def step_persons(city=city, vectorized=vectorized):
+            if vectorized:
+                City.step_persons(city)
+            else:
+                for person in city.schedule.get_breed_agents(Person):
+                    person.step()
+            states.append(person_state(city))
+        city.step_persons = step_persons
+        city.step()
+
+    vectorized_state, per_person_state = states
+    assert vectorized_state == per_person_state
+    # The step has people retiring and listing homes, not only working
+    assert {decision for _, decision, _ in vectorized_state[0].values()} >= {1, 2}
+    assert vectorized_state[1]
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+from mesa import Agent, Model
+
+from model.schedule import AgentArray, RandomActivationByBreed
+
+
+class Walker(Agent):
+    """Agent that logs each step, and can add or remove agents while stepping."""
+
+    soa_columns = {'value': np.float64}
+
+    def __init__(self, unique_id, model, value=0., on_step=None):
+        super().__init__(unique_id, model)
+        self.value   = value
+        self.on_step = on_step
+
+    def step(self):
+        self.model.stepped.append(self.unique_id)
+        if self.on_step is not None:
+            self.on_step(self)
+
+class Sitter(Walker):
+    """A second breed, stepped in row order."""
+
+    order_independent = True
+
+@pytest.fixture
+def model():
+    model          = Model(seed=1)
+    model.schedule = RandomActivationByBreed(model)
+    model.stepped  = []
+    return model
+
+def add_walkers(model, unique_ids, breed=Walker):
+    for unique_id in unique_ids:
+        model.schedule.add(breed(unique_id, model, value=10. * unique_id))
+
+def test_add_fills_columns_and_rows(model):
+    add_walkers(model, range(3))
+    arrays = model.schedule.agent_arrays[Walker]
+
+    assert len(arrays) == 3
+    assert list(arrays['value'][arrays.active_rows()]) == [0., 10., 20.]
+    assert [arrays.row(i) for i in range(3)] == [0, 1, 2]
+    assert arrays.row(100) == -1
+
+def test_arrays_grow_past_initial_capacity(model):
+    n = 3 * 64
+    add_walkers(model, range(n))
+    arrays = model.schedule.agent_arrays[Walker]
+
+    assert len(arrays.active) >= n
+    assert list(arrays['value'][:n]) == [10. * i for i in range(n)]
+    assert all(arrays.agents[arrays.row(i)].unique_id == i for i in range(n))
+    assert all(arrays.steppers[arrays.row(i)] is not None for i in range(n))
+
+def test_removed_rows_are_reused_after_the_step(model):
+    add_walkers(model, range(3))
+    arrays = model.schedule.agent_arrays[Walker]
+    removed_row = arrays.row(1)
+
+    model.schedule.remove(model.schedule._agents[1])
+    assert arrays.row(1) == -1
+    assert arrays.agents[removed_row] is None
+
+    # The row is only released, so an agent added now gets a new row
+    add_walkers(model, [3])
+    assert arrays.row(3) == 3
+
+    model.schedule.step_breed(Walker)
+    add_walkers(model, [4])
+    assert arrays.row(4) == removed_row
+    assert sorted(arrays.ids[arrays.active_rows()]) == [0, 2, 3, 4]
+
+def test_remove_missing_agent_raises(model):
+    add_walkers(model, range(2))
+    agent = model.schedule._agents[0]
+    model.schedule.remove(agent)
+
+    with pytest.raises(KeyError):
+        model.schedule.remove(agent)
+
+def test_breed_counts_and_ids(model):
+    add_walkers(model, range(4))
+    add_walkers(model, [10, 11], breed=Sitter)
+    model.schedule.remove(model.schedule._agents[2])
+
+    assert model.schedule.get_breed_count(Walker) == 3
+    assert model.schedule.get_breed_count(Sitter) == 2
+    assert model.schedule.get_breed_count(Agent)  == 0
+    assert list(model.schedule.get_breed_ids(Walker)) == [0, 1, 3]
+    assert list(model.schedule.get_breed_ids(Agent))  == []
+    assert list(model.schedule.agents_by_breed) == [Walker, Sitter]
+
+def test_step_order_follows_the_seed():
+    def step_order(seed):
+        model = Model(seed=seed)
+        model.schedule = RandomActivationByBreed(model)
+        model.stepped  = []
+        add_walkers(model, range(20))
+        model.schedule.step_breed(Walker)
+        return model.stepped
+
+    assert step_order(3) == step_order(3)
+    assert sorted(step_order(3)) == list(range(20))
+    assert step_order(3) != step_order(4)
+
+def test_reset_randomizer_restarts_the_step_order(model):
+    add_walkers(model, range(20))
+    model.schedule.step_breed(Walker)
+    first_order = list(model.stepped)
+
+    model.stepped.clear()
+    model.schedule.reset_randomizer(model._seed)
+    model.schedule.step_breed(Walker)
+
+    assert model.stepped == first_order
+
+def test_order_independent_breed_steps_in_row_order(model):
+    add_walkers(model, [5, 3, 8], breed=Sitter)
+    model.schedule.step_breed(Sitter)
+
+    assert model.stepped == [5, 3, 8]
+
+def test_agents_added_during_a_step_first_step_next_time(model):
+    def replace(agent):
+        model.schedule.remove(agent)
+        add_walkers(model, [agent.unique_id + 100])
+
+    model.schedule.add(Walker(0, model, on_step=replace))
+    add_walkers(model, range(1, 4))
+
+    model.schedule.step_breed(Walker)
+    assert sorted(model.stepped) == [0, 1, 2, 3]
+
+    model.stepped.clear()
+    model.schedule.step_breed(Walker)
+    assert sorted(model.stepped) == [1, 2, 3, 100]
+
+def test_step_name_calls_other_methods(model):
+    add_walkers(model, range(3))
+    for agent in model.schedule.agents:
+        agent.greet = lambda agent=agent: model.stepped.append(-agent.unique_id)
+
+    model.schedule.step_breed(Walker, step_name='greet')
+
+    assert sorted(model.stepped) == [-2, -1, 0]
+
+def test_swap_makes_the_next_state_current():
+    arrays = AgentArray({'value': np.float64, 'other': np.int64}, capacity=2, buffered=('value',))
+    for unique_id in range(3):
+        agent = Agent(unique_id, None)
+        agent.value, agent.other = 1. + unique_id, unique_id
+        arrays.add(agent)
+
+    assert set(arrays.next_columns) == {'value'}
+    assert list(arrays.next_columns['value'][:3]) == [1., 2., 3.]
+
+    rows    = arrays.active_rows()
+    current = arrays['value']
+    arrays.next_columns['value'][rows] = current[rows] * 10
+    arrays.swap()
+
+    assert list(arrays['value'][rows]) == [10., 20., 30.]
+    assert arrays.next_columns['value'] is current